@@ -0,0 +1,181 @@
+import asyncio
+import curses
+import inspect
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from table import Table
+from display import Display, TableDisplay
+from renderer import Renderer
+
+FRAME_INTERVAL = 1 / 60 # Frames are coalesced, so at most one is drawn per interval
+STATUS_INTERVAL = 0.5 # Elapsed times in the status line are updated this often
+
+class App:
+    """
+    asyncio driven editor. Keys are read, when stdin becomes readable, and handled one by one.
+    Work on the table (edits, recalculation, saving) runs on a single worker thread while holding
+    the table lock, so typing stays responsive meanwhile, frames are drawn from the table
+    only when the lock is free.
+    """
+    def __init__(self, console, table: Table, autosave: float):
+        self.console = console
+        self.table = table
+        self.autosave = autosave
+        self.display = Display(TableDisplay(table))
+        self.renderer = Renderer(console)
+        self.controls = self.display.get_controls()
+
+        self.keys: asyncio.Queue = asyncio.Queue()
+        self.dirty = asyncio.Event() # Set, when a frame has to be drawn
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="table")
+        self.lock = threading.Lock() # Held by the worker, while it uses the table
+        self.activities: Dict[str, float] = {} # Status line text -> start time
+        self.text_box: Optional[Tuple[str, int]] = None # Text and cursor position of the edited text
+        self.failure: Optional[BaseException] = None # Raised from the input loop, when a job fails
+
+    def _read_keys(self):
+        while True:
+            key = self.console.getch()
+            if key == curses.ERR:
+                return
+            self.keys.put_nowait(key)
+
+    async def next_key(self) -> int:
+        key = await self.keys.get()
+        if self.failure is not None:
+            raise self.failure
+        return key
+
+    def request_render(self):
+        self.dirty.set()
+
+    def show_text_box(self, text: Optional[str], cursor: int = 0):
+        """
+        Shows text being typed on the last line, None hides it
+        """
+        self.text_box = None if text is None else (text, cursor)
+        self.request_render()
+
+    def _status(self) -> str:
+        now = time.monotonic()
+        return " | ".join(f"{name}... {now - start:.0f}s" for name, start in self.activities.items())
+
+    def _draw(self):
+        # The table is not touched while the worker changes it, the previous frame stays on screen
+        if self.lock.acquire(blocking=False):
+            try:
+                self.renderer.render(self.console, self.display.render())
+            finally:
+                self.lock.release()
+
+        if self.text_box is not None:
+            curses.curs_set(1) # Normal
+            self.renderer.draw_line(*self.text_box)
+        else:
+            curses.curs_set(0) # Inivisible
+            self.renderer.draw_line(self._status())
+
+    async def _render_loop(self):
+        while True:
+            await self.dirty.wait()
+            self.dirty.clear()
+            self._draw()
+            await asyncio.sleep(FRAME_INTERVAL)
+
+    async def _status_loop(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            # Resizes only show up as KEY_RESIZE, when curses is asked for a key
+            self._read_keys()
+            if self.activities:
+                self.request_render()
+
+    async def _track(self, name: str, awaitable):
+        self.activities[name] = time.monotonic()
+        self.request_render()
+        try:
+            return await awaitable
+        finally:
+            del self.activities[name]
+            self.request_render()
+
+    async def run_job(self, function: "function", status: str):
+        """
+        Runs function on the worker thread while holding the table lock, status is shown meanwhile.
+        Background saves started by the job are tracked in the status line too
+        """
+        def locked():
+            with self.lock:
+                return function()
+
+        loop = asyncio.get_running_loop()
+        res = await self._track(status, loop.run_in_executor(self.worker, locked))
+        if self.table.saving is not None:
+            asyncio.create_task(self._watch_save(self.table.saving))
+        return res
+
+    async def _watch_save(self, saving: threading.Thread):
+        """
+        Shows a background save in the status line and its error, when it failed
+        """
+        if saving.is_alive():
+            join = asyncio.get_running_loop().run_in_executor(None, saving.join)
+            await (join if "Saving" in self.activities else self._track("Saving", join))
+        error, self.table.save_error = self.table.save_error, None
+        if error is not None:
+            self.display.table_display.show_message(f"Saving failed: {error}")
+            self.request_render()
+
+    def _job_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.failure = task.exception()
+            self.keys.put_nowait(curses.ERR) # Wakes up the input loop
+
+    def start_job(self, function: "function", status: str) -> asyncio.Task:
+        """
+        Like run_job, but returns at once, so keys are handled while the job runs
+        """
+        task = asyncio.create_task(self.run_job(function, status))
+        task.add_done_callback(self._job_done)
+        return task
+
+    async def _autosave_loop(self):
+        while True:
+            await asyncio.sleep(self.autosave)
+            if self.table.edits != self.table.saved_edits:
+                await self.run_job(lambda: self.table.save(background=True), "Autosaving")
+
+    async def _handle(self, key: int):
+        self.display.table_display.hide_message()
+        handler = self.controls.get_all().get(key)
+        if handler is None:
+            return
+        res = handler()
+        if inspect.isawaitable(res):
+            await res
+        elif res:
+            for request in res:
+                await request.accept(self)
+        self.request_render()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        stdin = sys.stdin.fileno() # Kept, the exit builtin closes sys.stdin
+        loop.add_reader(stdin, self._read_keys)
+        tasks = [asyncio.create_task(self._render_loop()), asyncio.create_task(self._status_loop())]
+        if self.autosave and self.table.journal is None: # Journaled edits are on disk already
+            tasks.append(asyncio.create_task(self._autosave_loop()))
+        self.request_render()
+        try:
+            while True:
+                await self._handle(await self.next_key())
+        finally:
+            loop.remove_reader(stdin)
+            for task in tasks:
+                task.cancel()
+            self.worker.shutdown(wait=False)
@@ -0,0 +1,110 @@
+"""
+Benchmark suite of the hot paths: loading, saving, lexing, parsing, recalculation and rendering
+of synthetic sheets. Results are written as JSON, so runs of different commits can be compared.
+
+Usage: python -m benchmarks [--sizes N...] [--sheets NAME...] [--repeat N] [--out PATH]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from typing import Callable, Dict, List, Optional
+
+from table import Table
+from display import TableDisplay
+from formula.lexer import Lexer
+from formula.parser import Parser
+from benchmarks.sheets import SHEETS
+
+SCREEN_SIZE = (50, 200) # Terminal lines and columns used for rendering
+
+def best_time(run: Callable[[], object], repeat: int, setup: Optional[Callable[[], object]] = None) -> float:
+    """
+    Shortest of repeat runs, setup is called before every run and is not timed
+    """
+    res = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        res = min(res, time.perf_counter() - start)
+    return res
+
+def _formula_texts(table: Table) -> List[str]:
+    return [table.storage.get(x, y)[1].text for x, y in table.storage.iter_formulas()]
+
+def _recalculate(table: Table):
+    table.recalculate_all()
+    for x, y in table.storage.iter_formulas():
+        table.get_cell(x, y).formula_value
+
+def _render(table: Table):
+    display = TableDisplay(table)
+    display.resize(*SCREEN_SIZE)
+    display.render()
+
+def bench_sheet(table: Table, repeat: int) -> Dict[str, float]:
+    content = table.to_elow()
+    texts = _formula_texts(table)
+    tokens = [Lexer(text).lex() for text in texts]
+
+    res = {
+        "save" : best_time(table.to_elow, repeat),
+        "open" : best_time(lambda: Table.from_elow(content, "bench.elow"), repeat),
+        "load" : best_time(lambda: Table.from_elow(content, "bench.elow").storage.load_all(), repeat),
+    }
+    if texts:
+        res["lex"] = best_time(lambda: [Lexer(text).lex() for text in texts], repeat)
+        res["parse"] = best_time(lambda: [Parser(list(token_list)).parse() for token_list in tokens], repeat)
+        res["recalc"] = best_time(lambda: _recalculate(table), repeat)
+    # Caches of displayed strings are dropped with formula results, so a reload gives a cold render
+    res["render_cold"] = best_time(lambda: _render(table), repeat,
+        setup=lambda: [table.storage.invalidate(x, y) for x, y in table.storage.iter_formulas()])
+    res["render"] = best_time(lambda: _render(table), repeat)
+    return res
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="rows of every sheet")
+    parser.add_argument("--sheets", nargs="+", choices=list(SHEETS), default=list(SHEETS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark, the fastest counts")
+    parser.add_argument("-o", "--out", help="JSON file to write results to, stdout by default")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    results = []
+    for name in args.sheets:
+        for size in args.sizes:
+            table = SHEETS[name](size)
+            table.recalculate_all()
+            for operation, seconds in bench_sheet(table, args.repeat).items():
+                results.append({"sheet" : name, "size" : size, "operation" : operation, "seconds" : seconds})
+                print(f"{name:>15} {size:>8} {operation:>12} {seconds*1000:>10.2f} ms", file=sys.stderr)
+
+    report = json.dumps({
+        "commit" : _commit(),
+        "python" : platform.python_version(),
+        "repeat" : args.repeat,
+        "results" : results,
+    }, indent=2)
+    if args.out is None:
+        print(report)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Structural edits (inserting and deleting rows and columns) of sheets opened from *.elow files,
+whose rows are read lazily. Every edit is checked against the same edit of a table built in memory,
+the exit status is 1, when formulas or their values differ.
+
+Usage: python -m benchmarks.edits [--sizes N...] [--repeat N]
+"""
+import argparse
+import sys
+
+from typing import Callable, Dict, List, Tuple
+
+from table import Table
+from cell import CellType
+from benchmarks.__main__ import best_time
+from benchmarks.sheets import SHEETS
+
+# Name -> edit of a table with size rows
+EDITS: Dict[str, Callable[[Table, int], None]] = {
+    "insert_rows"    : lambda table, size: table.insert_rows(size // 2, 10),
+    "delete_rows"    : lambda table, size: table.delete_rows(size // 2, 10),
+    "insert_columns" : lambda table, size: table.insert_columns(1, 2),
+    "delete_columns" : lambda table, size: table.delete_columns(1, 1),
+}
+
+def cells(table: Table) -> List[Tuple[int, int, str, str]]:
+    """
+    Formula texts or values and displayed strings of every cell
+    """
+    res = []
+    for y, row in table.storage.iter_rows():
+        for x, cell_type, value in row:
+            source = value.text if cell_type == CellType.formula else str(value)
+            res.append((x, y, source, table.display_at(x, y)))
+    return res
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.edits")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="rows of every sheet")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark, the fastest counts")
+    args = parser.parse_args(sys.argv[1:])
+
+    status = 0
+    for name, build in SHEETS.items():
+        for size in args.sizes:
+            content = build(size).to_elow()
+            for edit_name, edit in EDITS.items():
+                expected = Table.from_elow(content, "bench.elow")
+                expected.storage.load_all()
+                expected.recalculate_all()
+                edit(expected, size)
+
+                table = None
+                def setup():
+                    nonlocal table
+                    table = Table.from_elow(content, "bench.elow")
+                seconds = best_time(lambda: edit(table, size), args.repeat, setup=setup)
+                ok = cells(table) == cells(expected)
+                print(f"{name:>15} {size:>8} {edit_name:>15} {seconds*1000:>10.2f} ms {'' if ok else 'MISMATCH'}")
+                status |= not ok
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
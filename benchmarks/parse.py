@@ -0,0 +1,57 @@
+"""
+Parse throughput of the precedence climbing parser compared to the legacy three-pass one.
+
+Usage: python -m benchmarks.parse [--count N] [--terms N]
+"""
+import argparse
+import random
+import time
+
+from typing import Callable, List
+
+from formula.lexer import Lexer
+from formula.token import Token
+from formula.parser import Parser
+from benchmarks.legacy_parser import LegacyParser
+
+def generate_formula(terms: int, rng: random.Random) -> str:
+    parts = []
+    for index in range(terms):
+        kind = rng.randrange(4)
+        if kind == 0:
+            part = f":{rng.randrange(100)}:{rng.randrange(1000)}"
+        elif kind == 1:
+            part = str(rng.randrange(1000))
+        elif kind == 2:
+            part = f"sum(:{rng.randrange(100)}:{rng.randrange(1000)}, {rng.randrange(10)})"
+        else:
+            part = f"(:{rng.randrange(100)}:{rng.randrange(1000)}*2)"
+        parts.append(part)
+        if index != terms-1:
+            parts.append(rng.choice("+-*/"))
+    return "".join(parts)
+
+def time_parser(parse: Callable[[List[Token]], object], token_lists: List[List[Token]]) -> float:
+    start = time.perf_counter()
+    for tokens in token_lists:
+        # Legacy parser inserts into the list it was given, so both get a fresh copy
+        parse(list(tokens))
+    return time.perf_counter() - start
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--count", type=int, default=2000, help="amount of formulas to parse")
+    arg_parser.add_argument("--terms", type=int, nargs="+", default=[4, 32, 128], 
+        help="amount of operands in each formula")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'terms':>6} {'legacy f/s':>12} {'current f/s':>12} {'speedup':>8}")
+    for terms in args.terms:
+        token_lists = [Lexer(generate_formula(terms, rng)).lex() for _ in range(args.count)]
+        legacy = time_parser(lambda tokens: LegacyParser(tokens).parse(is_main=True), token_lists)
+        current = time_parser(lambda tokens: Parser(tokens).parse(), token_lists)
+        print(f"{terms:>6} {args.count/legacy:>12.0f} {args.count/current:>12.0f} {legacy/current:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
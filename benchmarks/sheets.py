@@ -0,0 +1,85 @@
+"""
+Synthetic sheets for benchmarks. Every generator is deterministic for a given size.
+"""
+import random
+
+from typing import Callable, Dict
+
+from table import Table
+from cell import Cell, CellType
+from formula.cache import parse_formula
+
+def _store_formula(table: Table, x: int, y: int, text: str):
+    table._store_cell(x, y, Cell(table, CellType.formula, parse_formula(text)))
+
+def dense_numeric(size: int, columns: int = 10) -> Table:
+    """
+    size rows of random numbers
+    """
+    rng = random.Random(size)
+    table = Table()
+    for y in range(size):
+        for x in range(columns):
+            table.storage.set(x, y, CellType.number, rng.uniform(-1000, 1000))
+    return table
+
+def formula_chains(size: int, columns: int = 10) -> Table:
+    """
+    Every column is a chain of size formulas, each one reading the one above
+    """
+    table = Table()
+    for x in range(columns):
+        table.storage.set(x, 0, CellType.number, float(x))
+        for y in range(1, size):
+            _store_formula(table, x, y, f":{x}:{y-1} * 1.0001 + :{x}:0")
+    return table
+
+def fan_in_sums(size: int, formulas: int = 100) -> Table:
+    """
+    A column of size numbers and formulas summing ever longer ranges of it
+    """
+    rng = random.Random(size)
+    table = Table()
+    for y in range(size):
+        table.storage.set(0, y, CellType.number, float(rng.randrange(1000)))
+    for index in range(formulas):
+        last = (index + 1) * (size - 1) // formulas
+        _store_formula(table, 1, index, f"sum(:0:0::0:{last}) + max(:0:0::0:{last})")
+    return table
+
+def derived_columns(size: int, columns: int = 4) -> Table:
+    """
+    Two columns of size random numbers and columns of formulas copied down next to them
+    """
+    rng = random.Random(size)
+    table = Table()
+    for y in range(size):
+        table.storage.set(0, y, CellType.number, rng.uniform(-1000, 1000))
+        table.storage.set(1, y, CellType.number, float(rng.randrange(1, 100)))
+        _store_formula(table, 2, y, f":0:{y}*:1:{y}+1")
+        for x in range(3, columns + 2):
+            _store_formula(table, x, y, f"abs(:{x-1}:{y})/:1:{y}-:0:{y}")
+    return table
+
+def long_text(size: int, columns: int = 4, length: int = 200) -> Table:
+    """
+    size rows of texts of about length characters
+    """
+    rng = random.Random(size)
+    words = ["elow", "cell", "table", "formula", "render", "chunk", "value", "column"]
+    table = Table()
+    for y in range(size):
+        for x in range(columns):
+            text = ""
+            while len(text) < length:
+                text += rng.choice(words) + " "
+            table.storage.set(x, y, CellType.text, text)
+    return table
+
+SHEETS: Dict[str, Callable[[int], Table]] = {
+    "dense_numeric" : dense_numeric,
+    "formula_chains" : formula_chains,
+    "fan_in_sums" : fan_in_sums,
+    "derived_columns" : derived_columns,
+    "long_text" : long_text,
+}
@@ -0,0 +1,84 @@
+"""
+Startup cost of elow runs, measured with python -X importtime. Every scenario has a budget
+of import time and modules, which it must never import, the exit status is 1, when any
+scenario breaks them, so scripts launching elow many times stay fast.
+
+Usage: python -m benchmarks.startup [--repeat N] [--scale X]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from typing import Dict, List, Set, Tuple
+
+from table import Table
+from cell import Cell, CellType
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EDITOR_MODULES = {"curses", "_curses", "asyncio", "display", "app"}
+FORMULA_MODULES = {"formula.lexer", "formula.parser", "formula.compiler", "formula.cache"}
+
+# Name -> (arguments of main.py with {dir} as the temporary directory, import budget in ms, forbidden modules)
+SCENARIOS: Dict[str, Tuple[List[str], float, Set[str]]] = {
+    "eval_plain"    : (["eval", "{dir}/plain.elow"], 130, EDITOR_MODULES | FORMULA_MODULES),
+    "convert_plain" : (["convert", "{dir}/plain.csv", "{dir}/out.elow"], 140, EDITOR_MODULES | FORMULA_MODULES),
+    "eval_formulas" : (["eval", "{dir}/formulas.elow"], 170, EDITOR_MODULES),
+}
+
+def write_sheets(directory: str):
+    plain = Table()
+    formulas = Table()
+    for y in range(10):
+        for x in range(3):
+            plain.add_cell(CellType.number, float(x + y))
+            formulas._store_cell(x, y, Cell.from_text(formulas, f"\\f :{x}:{y+1}+1" if y < 9 else "1"))
+        plain.cursor = (0, y + 1)
+    plain.save_to(os.path.join(directory, "plain.elow"))
+    plain.export_to(os.path.join(directory, "plain.csv"))
+    formulas.save_to(os.path.join(directory, "formulas.elow"))
+
+def import_times(arguments: List[str]) -> Tuple[float, Set[str]]:
+    """
+    Total import time in ms and names of the modules imported by a run of main.py
+    """
+    res = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py"), *arguments],
+                         capture_output=True, text=True, check=True, cwd=ROOT)
+    total = 0
+    modules = set()
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("package"):
+            continue
+        self_time, _, name = line.split("|")
+        total += int(self_time.removeprefix("import time:"))
+        modules.add(name.strip())
+    return total / 1000, modules
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--repeat", type=int, default=10, help="runs of every scenario, the median counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every budget, for slow machines")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        write_sheets(directory)
+        print(f"{'scenario':>15} {'imports ms':>11} {'budget ms':>10}  problems")
+        for name, (arguments, budget, forbidden) in SCENARIOS.items():
+            arguments = [argument.format(dir=directory) for argument in arguments]
+            runs = [import_times(arguments) for _ in range(args.repeat)]
+            milliseconds = statistics.median(total for total, _ in runs)
+            problems = []
+            if milliseconds > budget * args.scale:
+                problems.append("over budget")
+            imported = sorted(forbidden & runs[0][1])
+            if imported:
+                problems.append("imports " + ", ".join(imported))
+            failed = failed or bool(problems)
+            print(f"{name:>15} {milliseconds:>11.1f} {budget * args.scale:>10.1f}  {'; '.join(problems)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,19 @@
 import struct
 
 from enum import Enum, auto
-from typing import Dict, Iterator, Optional
+from typing import Dict, Optional, Tuple
 
-from formula.lexer import Lexer
-from formula.parser import Parser
-from formula.expr import MaybeFloat, ExprErrorType, expr_error_messages
-from utils import next_float, next_length_str
+from formula.expr import Formula, MaybeFloat, ExprErrorType, expr_error_messages
+from utils import read_float, read_length_str
+
+def parse_formula(text: str) -> Formula:
+    """
+    Imports the formula parser and compiler and replaces itself by formula.cache.parse_formula.
+    Sheets without formulas never load them, the first formula read loads them once
+    """
+    global parse_formula
+    from formula.cache import parse_formula
+    return parse_formula(text)
 
 class CellType(Enum):
     none = auto()
@@ -15,31 +22,54 @@ class CellType(Enum):
     formula = auto()
 
 class Cell:
-    def __init__(self, table: "Table", cell_type: CellType = CellType.none, value: object = None):
+    """
+    Lightweight view of a cell. Cells read from a table are created on demand
+    from its columnar storage and know their coordinates, so formula results
+    are cached by the storage rather than by the view.
+    """
+    __slots__ = ("table", "type", "value", "coords")
+
+    def __init__(self, table: "Table", cell_type: CellType = CellType.none, value: object = None,
+                 coords: Optional[Tuple[int, int]] = None):
         self.table = table
-        self.version = -1
         self.type = cell_type
         self.value: object = value
-        self._formula_value: Optional[MaybeFloat] = None
+        self.coords = coords
+
 
+    @classmethod
+    def from_text(cls, table: "Table", text: str) -> "Cell":
+        """
+        Cell typed in by user: numbers are anything float accepts, "\\f " starts a formula.
+        Raises InvalidFormula for malformed formulas
+        """
+        if not text:
+            return cls(table)
+        try:
+            return cls(table, CellType.number, float(text))
+        except ValueError:
+            if text.startswith("\\f "):
+                return cls(table, CellType.formula, parse_formula(text.removeprefix("\\f ")))
+            return cls(table, CellType.text, text)
 
     @classmethod
-    def parse_none_cell(cls, table: "Table", _):
-        table.add_cell()
+    def parse_none_cell(cls, table: "Table", _, offset: int) -> Tuple["Cell", int]:
+        return cls(table), offset
 
     @classmethod
-    def parse_text_cell(cls, table: "Table", content: Iterator):
-        table.add_cell(CellType.text, next_length_str(content))
+    def parse_text_cell(cls, table: "Table", content: memoryview, offset: int) -> Tuple["Cell", int]:
+        text, offset = read_length_str(content, offset)
+        return cls(table, CellType.text, text), offset
 
     @classmethod
-    def parse_number_cell(cls, table: "Table", content: Iterator):
-        table.add_cell(CellType.number, next_float(content))
+    def parse_number_cell(cls, table: "Table", content: memoryview, offset: int) -> Tuple["Cell", int]:
+        number, offset = read_float(content, offset)
+        return cls(table, CellType.number, number), offset
 
     @classmethod
-    def parse_formula_cell(cls, table: "Table", content: Iterator):
-        table.add_cell(CellType.formula, 
-            Parser(Lexer(next_length_str(content)).lex()).parse(is_main=True)
-        )
+    def parse_formula_cell(cls, table: "Table", content: memoryview, offset: int) -> Tuple["Cell", int]:
+        text, offset = read_length_str(content, offset)
+        return cls(table, CellType.formula, parse_formula(text)), offset
 
 
     def serealize_cell_type(self) -> bytes:
@@ -60,6 +90,19 @@ class Cell:
         return struct.pack("f", self.value)
 
 
+    def source_text(self) -> str:
+        """
+        Text, which Cell.from_text turns back into this cell
+        """
+        if self.type == CellType.none:
+            return ""
+        if self.type == CellType.number:
+            return str(int(self.value)) if self.value.is_integer() else repr(self.value)
+        if self.type == CellType.formula:
+            return "\\f " + self.value.text
+        return self.value
+
+
     def _display_number(self, num: float) -> str:
         if num.is_integer():
             return str(int(num))
@@ -96,13 +139,12 @@ class Cell:
         if self.type not in (CellType.formula, CellType.number, CellType.none):
             return ExprErrorType.cell_type_error
         if self.type == CellType.none:
-            return 0
+            return 0.0
         if self.type == CellType.number:
             return self.value
-        if self.table.version != self.version:
-            self._formula_value = self.value.execute(self.table)
-            self.version = self.table.version
-        return self._formula_value
+        if self.coords is None: # Not stored in the table, so there is no cache to use
+            return self.value.evaluate(self.table)
+        return self.table.value_at(*self.coords)
 
     def __str__(self) -> str:
         return self._cell_displayers[self.type](self)
\ No newline at end of file
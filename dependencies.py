@@ -0,0 +1,155 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+Coords = Tuple[int, int]
+Bounds = Tuple[int, int, int, int] # x1, y1, x2, y2 inclusive
+
+RANGE_BLOCK_BITS = 8
+
+class DependencyGraph:
+    """
+    Records which cells every formula reads, so an edit only has to
+    recompute the formulas that actually depend on it
+    """
+    def __init__(self):
+        self.precedents: Dict[Coords, Set[Coords]] = {}
+        self.dependents: Dict[Coords, Set[Coords]] = {}
+        self.range_precedents: Dict[Coords, List[Bounds]] = {}
+        # Ranges are put into grids of cells as big as them, so every range is in at most 2 by 2 cells
+        # whatever its area. (column level, row level, column cell, row cell) -> formulas with a range there
+        self.range_index: Dict[Tuple[int, int, int, int], Set[Tuple[Coords, Bounds]]] = {}
+        self.range_levels: Dict[Tuple[int, int], int] = {} # (column level, row level) -> amount of ranges
+        # Row block or column -> formulas with a reference or the last corner of a range there,
+        # so moving rows or columns finds formulas to rewrite without looking at every formula
+        self.row_index: Dict[int, Set[Coords]] = {}
+        self.column_index: Dict[int, Set[Coords]] = {}
+
+    @staticmethod
+    def _range_level(bounds: Bounds) -> Tuple[int, int]:
+        """
+        Bits of the grid cell size, which is the smallest one not narrower and not shorter than the range.
+        Rows come in blocks of 1 << RANGE_BLOCK_BITS, so short ranges of a column share a cell
+        """
+        x1, y1, x2, y2 = bounds
+        return (x2 - x1).bit_length(), ((y2 - y1) >> RANGE_BLOCK_BITS).bit_length() + RANGE_BLOCK_BITS
+
+    def _range_keys(self, bounds: Bounds) -> Iterable[Tuple[int, int, int, int]]:
+        x1, y1, x2, y2 = bounds
+        x_level, y_level = self._range_level(bounds)
+        for x in range(x1 >> x_level, (x2 >> x_level) + 1):
+            for y in range(y1 >> y_level, (y2 >> y_level) + 1):
+                yield x_level, y_level, x, y
+
+    def set_precedents(self, cell: Coords, precedents: Iterable[Coords], ranges: Iterable[Bounds] = ()):
+        self.remove(cell)
+        precedents = set(precedents)
+        if precedents:
+            self.precedents[cell] = precedents
+            for precedent in precedents:
+                self.dependents.setdefault(precedent, set()).add(cell)
+                self.row_index.setdefault(precedent[1] >> RANGE_BLOCK_BITS, set()).add(cell)
+                self.column_index.setdefault(precedent[0], set()).add(cell)
+
+        ranges = list(dict.fromkeys(ranges)) # A range read twice is indexed once
+        if ranges:
+            self.range_precedents[cell] = ranges
+            for bounds in ranges:
+                for key in self._range_keys(bounds):
+                    self.range_index.setdefault(key, set()).add((cell, bounds))
+                level = self._range_level(bounds)
+                self.range_levels[level] = self.range_levels.get(level, 0) + 1
+                self.row_index.setdefault(bounds[3] >> RANGE_BLOCK_BITS, set()).add(cell)
+                self.column_index.setdefault(bounds[2], set()).add(cell)
+
+    @staticmethod
+    def _unindex(index: Dict[int, Set[Coords]], key: int, cell: Coords):
+        entries = index.get(key)
+        if entries is not None:
+            entries.discard(cell)
+            if not entries:
+                del index[key]
+
+    def remove(self, cell: Coords):
+        for precedent in self.precedents.pop(cell, ()):
+            dependents = self.dependents[precedent]
+            dependents.discard(cell)
+            if not dependents:
+                del self.dependents[precedent]
+            self._unindex(self.row_index, precedent[1] >> RANGE_BLOCK_BITS, cell)
+            self._unindex(self.column_index, precedent[0], cell)
+
+        for bounds in self.range_precedents.pop(cell, ()):
+            for key in self._range_keys(bounds):
+                entries = self.range_index[key]
+                entries.discard((cell, bounds))
+                if not entries:
+                    del self.range_index[key]
+            level = self._range_level(bounds)
+            self.range_levels[level] -= 1
+            if not self.range_levels[level]:
+                del self.range_levels[level]
+            self._unindex(self.row_index, bounds[3] >> RANGE_BLOCK_BITS, cell)
+            self._unindex(self.column_index, bounds[2], cell)
+
+    def referencing_rows(self, y: int) -> Set[Coords]:
+        """
+        Formulas, which may read a cell at row y or below
+        """
+        return set().union(*[formulas for block, formulas in self.row_index.items() if block >= y >> RANGE_BLOCK_BITS])
+
+    def referencing_columns(self, x: int) -> Set[Coords]:
+        """
+        Formulas, which may read a cell at column x or right of it
+        """
+        return set().union(*[formulas for column, formulas in self.column_index.items() if column >= x])
+
+    def dependents_of(self, cell: Coords) -> Set[Coords]:
+        """
+        Formulas, which read the cell directly or through a range
+        """
+        dependents = self.dependents.get(cell, set())
+        x, y = cell
+        for x_level, y_level in self.range_levels:
+            ranged = self.range_index.get((x_level, y_level, x >> x_level, y >> y_level))
+            if ranged:
+                dependents = dependents | {
+                    formula for formula, (x1, y1, x2, y2) in ranged if x1 <= x <= x2 and y1 <= y <= y2
+                }
+        return dependents
+
+    def transitive_dependents(self, changed: Iterable[Coords]) -> Set[Coords]:
+        """
+        Returns changed cells together with every cell, which reads them directly or indirectly
+        """
+        stack = list(changed)
+        seen = set(stack)
+        while stack:
+            for dependent in self.dependents_of(stack.pop()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+
+        return seen
+
+    def topological_order(self, cells: Set[Coords]) -> List[Coords]:
+        """
+        Orders cells, so every cell comes after the cells it reads.
+        Cells, which are part of a cycle, are left out.
+        """
+        in_degree = {cell : 0 for cell in cells}
+        edges = {}
+        for cell in cells:
+            edges[cell] = [dependent for dependent in self.dependents_of(cell) if dependent in in_degree]
+            for dependent in edges[cell]:
+                in_degree[dependent] += 1
+
+        ready = [cell for cell, degree in in_degree.items() if degree == 0]
+        order = []
+        while ready:
+            cell = ready.pop()
+            order.append(cell)
+            for dependent in edges[cell]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    ready.append(dependent)
+
+        return order
@@ -1,18 +1,52 @@
 import curses # Key constants
 
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from table import Table, Cell, CellType
-from formula.lexer import Lexer
-from formula.parser import Parser, InvalidFormula
-from request import TextBoxRequest, Controls
+from table import Table, Cell
+from formula.expr import InvalidFormula
+from request import CommandRequest, TextBoxRequest, Controls
 from pallet import Pallet
+from renderer import Frame
 
 class TableDisplay:
     def __init__(self, table: Table):
         self.table = table
         self.window_size: Tuple[int, int] = (12, 12)
         self.window_pos: Tuple[int, int] = (0, 0)
+        self.screen_size: Optional[Tuple[int, int]] = None # (height, width), fixed window if not set
+        # Column -> (displayed strings, width) from the previous frame, valid for _columns_rows only
+        self._columns: Dict[int, Tuple[List[str], int]] = {}
+        self._columns_rows: Tuple[int, int] = (0, 0)
+        self.status: Optional[str] = None # Shown on the line under the table
+        self.message = False # Status is a message, which goes away with the next key
+
+    def resize(self, height: int, width: int):
+        """
+        Fits the window into a terminal: one line is taken by the header and one by text boxes,
+        amount of columns depends on their widths and is found on every render
+        """
+        self.screen_size = (height, width)
+        self.window_size = (self.window_size[0], max(height-2-(self.status is not None), 1))
+
+    def show_status(self, text: Optional[str]):
+        """
+        Shows text under the table, None hides the status line
+        """
+        self.status = text
+        self.message = False
+        if self.screen_size is not None:
+            self.resize(*self.screen_size)
+
+    def show_message(self, text: str):
+        """
+        Shows text under the table until the next key is pressed
+        """
+        self.show_status(text)
+        self.message = True
+
+    def hide_message(self):
+        if self.message:
+            self.show_status(None)
 
     def to_win_x(self, x: int):
         return x - self.window_pos[0]
@@ -23,24 +57,50 @@ class TableDisplay:
     def to_win_coords(self, coords: Tuple[int, int]):
         return (self.to_win_x(coords[0]), self.to_win_y(coords[1]))
 
-    def _get_window(self) -> List[List[Cell]]:
-        return [row[self.window_pos[0]:self.window_pos[0]+self.window_size[0]] for row in 
-            self.table.rows[self.window_pos[1]:self.window_pos[1]+self.window_size[1]]]
-
-    def _get_col_sizes(self) -> List[int]:
-        col_sizes = [len(str(offset + self.window_pos[0])) 
-            for offset in range(self.window_size[1])]
-        for row in self._get_window():
-            for col, cell in enumerate(row):
-                col_sizes[col] = max(len(str(cell)), col_sizes[col])
-
-        return col_sizes
-
-    def _apply_selection_styles(self, text: str) -> str:
+    def _get_column(self, x: int) -> Tuple[List[str], int]:
+        """
+        Displayed strings of a visible column and its width. Strings are memoized by the table,
+        width is only recomputed when one of the strings changed since the previous frame.
+        """
+        strings = [self.table.display_at(x, y) 
+            for y in range(self.window_pos[1], self.window_pos[1]+self.window_size[1])]
+        previous = self._columns.get(x)
+        if previous is not None and previous[0] == strings:
+            return previous
+        column = (strings, max(len(str(x)), *map(len, strings)))
+        self._columns[x] = column
+        return column
+
+    def _get_columns(self, label_size: int) -> List[Tuple[List[str], int]]:
+        rows = (self.window_pos[1], self.window_size[1])
+        if rows != self._columns_rows:
+            self._columns.clear()
+            self._columns_rows = rows
+
+        if self.screen_size is None:
+            return [self._get_column(x) 
+                for x in range(self.window_pos[0], self.window_pos[0]+self.window_size[0])]
+
+        columns = []
+        used = label_size
+        x = self.window_pos[0]
+        while True:
+            column = self._get_column(x)
+            if columns and used + 1 + column[1] > self.screen_size[1]:
+                break
+            columns.append(column)
+            used += 1 + column[1]
+            x += 1
+
+        for x in [x for x in self._columns if not self.window_pos[0] <= x < self.window_pos[0]+len(columns)]:
+            del self._columns[x]
+        return columns
+
+    def _get_selection_attr(self, text: str) -> int:
         if text.isspace():
-            return "\033[47m" + text + "\033[0m"
+            return curses.A_REVERSE
         else:
-            return "\033[1m" + text + "\033[0m"
+            return curses.A_BOLD
 
     def update_win_pos_by_cursor(self):
         cursor = self.to_win_coords(self.table.cursor)
@@ -53,31 +113,31 @@ class TableDisplay:
         if cursor[1] < 0:
             self.window_pos = (self.window_pos[0], self.table.cursor[1])
 
-    def _update_selected_cell(self, text: str):
-        if not text:
-            self.table.rows[self.table.cursor[1]][self.table.cursor[0]] = \
-                Cell(self.table)
-            return
+    def _update_selected_cell(self, text: str, cursor: Tuple[int, int]):
         try:
-            self.table.rows[self.table.cursor[1]][self.table.cursor[0]] = \
-                Cell(self.table, CellType.number, float(text))
-        except ValueError:
-            if text.startswith("\\f "): 
-                try:
-                    expr = Parser(Lexer(text.removeprefix("\\f ")).lex()).parse(is_main=True)
-                    self.table.rows[self.table.cursor[1]][self.table.cursor[0]] = \
-                        Cell(self.table, CellType.formula, expr)
-                except InvalidFormula:
-                    pass
-            else:
-                self.table.rows[self.table.cursor[1]][self.table.cursor[0]] = \
-                    Cell(self.table, CellType.text, text)
+            cell = Cell.from_text(self.table, text)
+        except InvalidFormula:
+            return
+
+        self.table.set_cell(*cursor, cell)
+
+    def _on_terminal_resize(self):
+        curses.update_lines_cols() # LINES and COLS keep the size of initscr otherwise
+        self.resize(curses.LINES, curses.COLS)
 
     def _open_pallet(self):
         return [Pallet(self).get_request()]
 
     def _change_selected_content(self):
-        return [TextBoxRequest(self._update_selected_cell)]
+        return [TextBoxRequest(self._update_selected_cell, "Recalculating")]
+
+    def _undo(self):
+        if not self.table.history.undo():
+            self.show_message("Nothing to undo")
+
+    def _redo(self):
+        if not self.table.history.redo():
+            self.show_message("Nothing to redo")
 
     def get_controls(self) -> Controls:
         return Controls({
@@ -87,32 +147,44 @@ class TableDisplay:
             curses.KEY_RIGHT : lambda: self.table.move_cursor( 1,  0),
             ord(" ") : self._change_selected_content,
             0 : self._open_pallet,# ctrl + SPACE
-            19 : lambda: self.table.save_to(self.table.path) # ctrl + S
+            19 : lambda: [CommandRequest(lambda: self.table.save(background=True), "Saving")], # ctrl + S
+            26 : lambda: [CommandRequest(self._undo, "Undoing")], # ctrl + Z
+            25 : lambda: [CommandRequest(self._redo, "Redoing")], # ctrl + Y
+            curses.KEY_RESIZE : self._on_terminal_resize,
         })
 
-    def render(self) -> str:
-        self.table.version += 1
+    def render(self) -> Frame:
         self.update_win_pos_by_cursor()
-        col_sizes = self._get_col_sizes()
-        string_table: List[List[str]] = []
-        cursor = self.to_win_coords(self.table.cursor)
-        for row in [range(self.window_pos[0], self.window_pos[0]+self.window_size[0])] + self._get_window():
-            string_row = []
-            for cell, col_size in zip(row, col_sizes):
-                string_cell = str(cell)
-                string_row.append(string_cell + (col_size-len(string_cell)) * " ")
-            string_table.append(string_row)
         size = len(str(self.window_pos[1]+self.window_size[1]-1))
-        for index, row in zip(range(self.window_pos[1], self.window_pos[1]+self.window_size[1]), string_table[1:]):
-            text = str(index)
-            row.insert(0, " " * (size - len(text)) + text)
-        
-        string_table[0].insert(0, " " * size)
+        columns = self._get_columns(size)
+        self.window_size = (len(columns), self.window_size[1])
+        # Columns have different widths, so the cursor can still be right of the window
+        while self.table.cursor[0] >= self.window_pos[0] + self.window_size[0]:
+            self.window_pos = (self.window_pos[0]+1, self.window_pos[1])
+            columns = self._get_columns(size)
+            self.window_size = (len(columns), self.window_size[1])
+
+        string_table: List[List[str]] = [[" " * size]]
+        for offset, (_, col_size) in enumerate(columns):
+            text = str(self.window_pos[0] + offset)
+            string_table[0].append(text + (col_size-len(text)) * " ")
+        for offset in range(self.window_size[1]):
+            text = str(self.window_pos[1] + offset)
+            string_row = [" " * (size - len(text)) + text]
+            for strings, col_size in columns:
+                string_row.append(strings[offset] + (col_size-len(strings[offset])) * " ")
+            string_table.append(string_row)
+
+        frame = [[(text, curses.A_NORMAL) for text in row] for row in string_table]
 
         # Make selected cell bold
-        string_table[cursor[1]+1][cursor[0]+1] = self._apply_selection_styles(string_table[cursor[1]+1][cursor[0]+1])
+        cursor = self.to_win_coords(self.table.cursor)
+        selected = string_table[cursor[1]+1][cursor[0]+1]
+        frame[cursor[1]+1][cursor[0]+1] = (selected, self._get_selection_attr(selected))
 
-        return "\n".join([" ".join(row) for row in string_table])
+        if self.status is not None:
+            frame.append([(self.status, curses.A_REVERSE)])
+        return frame
 
 # This class is pretty much usless wrapper for now, but it will be used later
 class Display:
@@ -124,5 +196,5 @@ class Display:
             27 : exit, # escape
         }) + self.table_display.get_controls()
 
-    def render(self) -> str:
+    def render(self) -> Frame:
         return self.table_display.render()
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Parsed formula cache. Formula texts are canonicalized by writing every reference relative
+to the first one, so formulas, which only differ by a uniform shift of their references,
+are parsed once and share the template expression, which is compiled right away.
+"""
+from typing import Dict, Match, Optional, Tuple
+
+from .expr import REFERENCE, Expr, ExprType, Formula
+from .lexer import Lexer
+from .parser import Parser
+from .compiler import compile_expr
+
+MAX_ENTRIES = 1 << 16 # Caches are dropped, when they grow past this
+
+# Canonical text -> template, position of its first reference and amount of references
+_templates: Dict[str, Tuple[Expr, int, int, int]] = {}
+# Formulas, which can't be templates (without references or written unusually), by text
+_exact: Dict[str, Formula] = {}
+
+def _count_references(expr: Expr) -> int:
+    if expr.type == ExprType.cell:
+        return 1
+    if expr.type == ExprType.range:
+        return 2
+    return sum(map(_count_references, expr.arguments))
+
+def _template_key(text: str) -> Optional[Tuple[str, int, int, int]]:
+    """
+    Canonical text, position of the first reference and amount of references, None without references
+    """
+    first = REFERENCE.search(text)
+    if first is None:
+        return None
+    x, y = int(first[1]), int(first[2])
+    count = 0
+    def relative(match: Match) -> str:
+        nonlocal count
+        count += 1
+        # Never appears in a valid formula, so a canonical text can't equal a real one
+        return f"\0{int(match[1]) - x},{int(match[2]) - y}"
+    return REFERENCE.sub(relative, text), x, y, count
+
+def _from_template(key: str, x: int, y: int, count: int) -> Optional[Formula]:
+    template = _templates.get(key)
+    if template is None or template[3] != count:
+        return None
+    expr, template_x, template_y, _ = template
+    return Formula(expr, x - template_x, y - template_y)
+
+def parse_formula(text: str) -> Formula:
+    """
+    Parses a formula text or reuses a template of an equivalent one. Raises InvalidFormula
+    """
+    formula = _exact.get(text)
+    if formula is not None:
+        return formula
+
+    source_key = _template_key(text)
+    if source_key is not None:
+        formula = _from_template(*source_key)
+        if formula is not None:
+            return formula
+
+    expr = Parser(Lexer(text).lex()).parse()
+    # Templates are keyed by the parsed text, so texts typed with spaces share them too
+    key = source_key if expr.text == text else _template_key(expr.text)
+    if key is not None:
+        formula = _from_template(*key)
+        if formula is not None:
+            if source_key is not None and source_key[1:] == key[1:]:
+                _templates[source_key[0]] = _templates[key[0]]
+            return formula
+
+    compile_expr(expr)
+    formula = Formula(expr)
+    # Texts are only shifted by rewriting their references, which needs every reference
+    # of the parsed text to be found
+    if key is not None and _count_references(expr) == key[3]:
+        if len(_templates) >= MAX_ENTRIES:
+            _templates.clear()
+        _templates[key[0]] = (expr, key[1], key[2], key[3])
+        if source_key is not None and source_key[1:] == key[1:]:
+            _templates[source_key[0]] = _templates[key[0]]
+    else:
+        if len(_exact) >= MAX_ENTRIES:
+            _exact.clear()
+        _exact[text] = formula
+    return formula
@@ -0,0 +1,80 @@
+import operator
+
+from typing import Callable, Dict, List
+
+from .expr import Compiled, Expr, ExprType, ExprErrorType, MaybeFloat
+from .functions import RangeArg, elow_functions
+
+def _compile_cell_expr(expr: Expr) -> Compiled:
+    x, y = expr.value
+    return lambda table, dx, dy: table.value_at(x + dx, y + dy)
+
+def _compile_range_expr(expr: Expr) -> Compiled:
+    return RangeArg(expr.value)
+
+def _compile_constant_expr(expr: Expr) -> Compiled:
+    value = expr.value
+    return lambda table, dx, dy: value
+
+def _compile_func_expr(expr: Expr) -> Compiled:
+    if expr.value not in elow_functions:
+        return lambda table, dx, dy: ExprErrorType.name_error
+
+    function = elow_functions[expr.value]
+    args: List[Compiled] = [compile_expr(arg) for arg in expr.arguments]
+    return lambda table, dx, dy: function(table, args, dx, dy)
+
+def _binary_compiler(f: Callable[[float, float], float]) -> Callable[[Expr], Compiled]:
+    def compiler(expr: Expr) -> Compiled:
+        left_expr, right_expr = expr.arguments
+        left = compile_expr(left_expr)
+
+        # Constants are by far the most common right operand, so they are bound directly
+        if right_expr.type == ExprType.constant:
+            right_value = right_expr.value
+
+            def binary_constant(table: "Table", dx: int, dy: int) -> MaybeFloat:
+                a = left(table, dx, dy)
+                if a.__class__ is ExprErrorType:
+                    return a
+                return f(a, right_value)
+
+            return binary_constant
+
+        right = compile_expr(right_expr)
+
+        def binary(table: "Table", dx: int, dy: int) -> MaybeFloat:
+            a = left(table, dx, dy)
+            if a.__class__ is ExprErrorType:
+                return a
+            b = right(table, dx, dy)
+            if b.__class__ is ExprErrorType:
+                return b
+            return f(a, b)
+
+        return binary
+
+    return compiler
+
+_expr_type_compilers: Dict[ExprType, Callable[[Expr], Compiled]] = {
+    ExprType.cell     : _compile_cell_expr,
+    ExprType.range    : _compile_range_expr,
+    ExprType.constant : _compile_constant_expr,
+    ExprType.func     : _compile_func_expr,
+    ExprType.error    : _compile_constant_expr,
+
+    ExprType.add : _binary_compiler(operator.add),
+    ExprType.sub : _binary_compiler(operator.sub),
+    ExprType.mul : _binary_compiler(operator.mul),
+    ExprType.div : _binary_compiler(operator.truediv),
+}
+
+def compile_expr(expr: Expr) -> Compiled:
+    """
+    Turns expression tree into a single callable, which evaluates it for a table with every
+    reference shifted by (dx, dy). Result is cached on the expression, so every tree
+    is compiled only once, even if it is a template shared by many formulas.
+    """
+    if expr.compiled is None:
+        expr.compiled = _expr_type_compilers[expr.type](expr)
+    return expr.compiled
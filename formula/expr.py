@@ -1,9 +1,21 @@
+import re
+
 from enum import Enum, auto
-from typing import List, Dict, Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# Coordinates of a reference in a formula text, ranges are matched as two references
+REFERENCE = re.compile(r":(0|[1-9][0-9]*):(0|[1-9][0-9]*)(?![\w.])")
+# Reference with an optional second corner, so ranges are matched as a whole
+REFERENCE_OR_RANGE = re.compile(
+    r":(0|[1-9][0-9]*):(0|[1-9][0-9]*)(?:::(0|[1-9][0-9]*):(0|[1-9][0-9]*))?(?![\w.])"
+)
 
+class InvalidFormula(BaseException):
+    pass
 
 class ExprType(Enum):
     cell = auto()
+    range = auto()
     constant = auto()
     func = auto()
 
@@ -12,22 +24,67 @@ class ExprType(Enum):
     mul = auto()
     div = auto()
 
+    error = auto() # Error literal, like !#POS left by deleting a referenced cell
+
 class ExprErrorType(Enum):
     cell_type_error = auto()
     name_error = auto() 
     argument_error = auto()
     position_eror = auto()
+    cycle_error = auto()
 
 expr_error_messages: Dict[ExprErrorType, str] = {
     ExprErrorType.cell_type_error : "!#TYPE",
     ExprErrorType.name_error      : "!#NAME",
     ExprErrorType.argument_error  : "!#ARG",
-    ExprErrorType.position_eror   : "!#POS"
+    ExprErrorType.position_eror   : "!#POS",
+    ExprErrorType.cycle_error     : "!#CYCLE",
 }
 
 MaybeFloat = Union[float, ExprErrorType]
 MaybeFloatList = Union[List[float], ExprErrorType]
-
+# Compiled expressions get the table and a shift (dx, dy) added to every reference
+Compiled = Callable[["Table", int, int], MaybeFloat]
+
+def shift_text(text: str, dx: int, dy: int) -> str:
+    return REFERENCE.sub(lambda match: f":{int(match[1]) + dx}:{int(match[2]) + dy}", text)
+
+def move_references(text: str, rows: bool, start: int, count: int) -> str:
+    """
+    Rewrites references of a formula text after inserting count rows (or columns) before start,
+    negative count is deleting -count of them from start on. References to deleted cells
+    and ranges, which are deleted as a whole, become !#POS, other ranges shrink or grow
+    """
+    deleted = max(-count, 0)
+
+    def move(low: int, high: int) -> Optional[Tuple[int, int]]:
+        if count > 0:
+            return low + count if low >= start else low, high + count if high >= start else high
+        if start <= low and high < start + deleted:
+            return None
+        if low >= start:
+            low = max(low - deleted, start)
+        if high >= start:
+            high = start - 1 if high < start + deleted else high - deleted
+        return low, high
+
+    def rewrite(match: re.Match) -> str:
+        x1, y1 = int(match[1]), int(match[2])
+        x2, y2 = (x1, y1) if match[3] is None else (int(match[3]), int(match[4]))
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        moved = move(y1, y2) if rows else move(x1, x2)
+        if moved is None:
+            return expr_error_messages[ExprErrorType.position_eror]
+        if rows:
+            y1, y2 = moved
+        else:
+            x1, x2 = moved
+        if match[3] is None:
+            return f":{x1}:{y1}"
+        return f":{x1}:{y1}::{x2}:{y2}"
+
+    return REFERENCE_OR_RANGE.sub(rewrite, text)
 
 class Expr:
     def __init__(self, text: str, type: ExprType, arguments: List["Expr"] = None, value: Optional[object] = None):
@@ -35,64 +92,69 @@ class Expr:
         self.type = type
         self.arguments = [] if arguments is None else arguments
         self.value = value
+        self.compiled: Optional[Compiled] = None # Set by formula.compiler
+        self._referenced: Optional[Tuple[List[Tuple[int, int]], List[Tuple[int, int, int, int]]]] = None
+
+    def references(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields coordinates of every cell read by the expression, including function arguments
+        """
+        if self.type == ExprType.cell:
+            yield self.value
+        for arg in self.arguments:
+            yield from arg.references()
+
+    def ranges(self) -> Iterator[Tuple[int, int, int, int]]:
+        """
+        Yields bounds of every range read by the expression as (x1, y1, x2, y2)
+        """
+        if self.type == ExprType.range:
+            yield self.value
+        for arg in self.arguments:
+            yield from arg.ranges()
+
+    def referenced(self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int, int, int]]]:
+        """
+        Lists of references() and ranges(), collected once for templates shared by many formulas
+        """
+        if self._referenced is None:
+            self._referenced = (list(self.references()), list(self.ranges()))
+        return self._referenced
 
-    def _execute_cell_expr(self, table: "Table") -> MaybeFloat:
-        try:
-            return table.rows[self.value[1]][self.value[0]].formula_value
-        except IndexError:
-            return ExprErrorType.position_eror
-
-    def _execute_constant_expr(self, table: "Table") -> float:
-        return self.value
-
-    def _execute_func_expr(self, table: "Table") -> MaybeFloat:
-        # To avoid circular import import is placed in here  
-        from .functions import elow_functions
-        
-        if self.value not in elow_functions:
-            return ExprErrorType.name_error
-
-        return elow_functions[self.value](table, self.arguments)
-
-    def _error_execute(self, a: MaybeFloat, b: MaybeFloat, f: "function") -> MaybeFloat:
-        if isinstance(a, ExprErrorType):
-            return a
-        if isinstance(b, ExprErrorType):
-            return b
-        
-        return f(a, b)
-
-    def _execute_binary_expr(self, table: "Table", f: "function") -> MaybeFloat:
-        return self._error_execute(
-            self.arguments[0].execute(table), self.arguments[1].execute(table),
-            f
-        )
-
-    def _execute_add_expr(self, table: "Table") -> MaybeFloat:
-        return self._execute_binary_expr(table, lambda a, b: a + b)
-
-    def _execute_sub_expr(self, table: "Table") -> MaybeFloat:
-        return self._execute_binary_expr(table, lambda a, b: a - b)
-
-    def _execute_mul_expr(self, table: "Table") -> MaybeFloat:
-        return self._execute_binary_expr(table, lambda a, b: a * b)
-
-    def _execute_div_expr(self, table: "Table") -> MaybeFloat:
-        return self._execute_binary_expr(table, lambda a, b: a / b)
-
-    _expr_type_executors: Dict[ExprType, "function"] = {
-        ExprType.cell     : _execute_cell_expr,
-        ExprType.constant : _execute_constant_expr,
-        ExprType.func     : _execute_func_expr,
-
-        ExprType.add : _execute_add_expr,
-        ExprType.sub : _execute_sub_expr,
-        ExprType.mul : _execute_mul_expr,
-        ExprType.div : _execute_div_expr,
-    }
-
-    def execute(self, table: "Table") -> MaybeFloat:
-        return self._expr_type_executors[self.type](self, table)
+    def __str__(self) -> str:
+        return self.text
+
+class Formula:
+    """
+    Formula of a cell. Formulas, whose texts differ only by a uniform shift of every reference
+    (like a formula copied down a column), share one parsed and compiled template.
+    """
+    __slots__ = ("template", "dx", "dy")
+
+    def __init__(self, template: Expr, dx: int = 0, dy: int = 0):
+        self.template = template
+        self.dx = dx
+        self.dy = dy
+
+    @property
+    def text(self) -> str:
+        if self.dx == 0 and self.dy == 0:
+            return self.template.text
+        return shift_text(self.template.text, self.dx, self.dy)
+
+    def evaluate(self, table: "Table") -> MaybeFloat:
+        """
+        Formulas made by formula.cache.parse_formula have their template compiled
+        """
+        return self.template.compiled(table, self.dx, self.dy)
+
+    def references(self) -> Iterator[Tuple[int, int]]:
+        for x, y in self.template.referenced()[0]:
+            yield x + self.dx, y + self.dy
+
+    def ranges(self) -> Iterator[Tuple[int, int, int, int]]:
+        for x1, y1, x2, y2 in self.template.referenced()[1]:
+            yield x1 + self.dx, y1 + self.dy, x2 + self.dx, y2 + self.dy
 
     def __str__(self) -> str:
         return self.text
\ No newline at end of file
@@ -1,13 +1,25 @@
 import math
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 
-from .expr import MaybeFloat, MaybeFloatList, Expr, ExprErrorType
+from .expr import Compiled, MaybeFloat, MaybeFloatList, ExprErrorType
 
-def execute_args(table: "Table", args: List[Expr], count: Optional[int] = None) -> MaybeFloatList:
+class RangeArg:
+    """
+    Compiled range. Aggregate functions read it as a whole block of numbers,
+    used as a single value it is an argument error.
+    """
+    def __init__(self, bounds: Tuple[int, int, int, int]):
+        self.bounds = bounds
+
+    def __call__(self, table: "Table", dx: int, dy: int) -> MaybeFloat:
+        return ExprErrorType.argument_error
+
+def execute_args(table: "Table", args: List[Compiled], dx: int, dy: int,
+                 count: Optional[int] = None) -> MaybeFloatList:
     res = []
     for arg in args:
-        res.append(arg.execute(table))
+        res.append(arg(table, dx, dy))
         if isinstance(res[-1], ExprErrorType):
             return res[-1]
     
@@ -15,11 +27,33 @@ def execute_args(table: "Table", args: List[Expr], count: Optional[int] = None)
         return ExprErrorType.argument_error
     
     return res
+
+def execute_aggregate_args(table: "Table", args: List[Compiled], 
+                           dx: int, dy: int) -> Union[List[Sequence[float]], ExprErrorType]:
+    """
+    Evaluates arguments into blocks of numbers: one block with all single values
+    followed by contiguous blocks of every range, empty cells of ranges are skipped
+    """
+    values = []
+    res = [values]
+    for arg in args:
+        if arg.__class__ is RangeArg:
+            x1, y1, x2, y2 = arg.bounds
+            blocks = table.range_values(x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+            if isinstance(blocks, ExprErrorType):
+                return blocks
+            res.extend(blocks)
+        else:
+            values.append(arg(table, dx, dy))
+            if isinstance(values[-1], ExprErrorType):
+                return values[-1]
+
+    return res
     
 
 def to_elow_function(f: "function", count: Optional[int] = None) -> MaybeFloat:
-    def temp(table: "Table", args_expr: List[Expr]):
-        args = execute_args(table, args_expr, count=count)
+    def temp(table: "Table", compiled_args: List[Compiled], dx: int, dy: int):
+        args = execute_args(table, compiled_args, dx, dy, count=count)
         if isinstance(args, ExprErrorType):
             return args
 
@@ -27,8 +61,15 @@ def to_elow_function(f: "function", count: Optional[int] = None) -> MaybeFloat:
 
     return temp    
 
-def elow_sum(args: List[int]) -> float:
-    return sum(args)
+def to_elow_aggregate(f: "function") -> MaybeFloat:
+    def temp(table: "Table", compiled_args: List[Compiled], dx: int, dy: int):
+        blocks = execute_aggregate_args(table, compiled_args, dx, dy)
+        if isinstance(blocks, ExprErrorType):
+            return blocks
+
+        return f(blocks)
+
+    return temp
 
 def elow_pi(args: List[int]) -> float:
     return math.pi
@@ -36,11 +77,43 @@ def elow_pi(args: List[int]) -> float:
 def elow_abs(args: List[int]) -> float:
     return abs(args[0])
 
+def elow_sum(blocks: List[Sequence[float]]) -> float:
+    return sum(map(sum, blocks), 0.0)
+
+def elow_count(blocks: List[Sequence[float]]) -> float:
+    return float(sum(map(len, blocks)))
+
+def elow_avg(blocks: List[Sequence[float]]) -> MaybeFloat:
+    count = elow_count(blocks)
+    if count == 0:
+        return ExprErrorType.argument_error
+    return elow_sum(blocks) / count
+
+def elow_min(blocks: List[Sequence[float]]) -> MaybeFloat:
+    minimums = [min(block) for block in blocks if len(block)]
+    if not minimums:
+        return ExprErrorType.argument_error
+    return min(minimums)
+
+def elow_max(blocks: List[Sequence[float]]) -> MaybeFloat:
+    maximums = [max(block) for block in blocks if len(block)]
+    if not maximums:
+        return ExprErrorType.argument_error
+    return max(maximums)
+
 elow_functions: Dict[str, "function"] = {
     k : to_elow_function(v[0], count=v[1]) for k, v in 
     {
-        "sum" : (elow_sum, None),
         "pi"  : (elow_pi,  0),
         "abs" : (elow_abs, 1),
     }.items()
-}
\ No newline at end of file
+} | {
+    k : to_elow_aggregate(v) for k, v in
+    {
+        "sum"   : elow_sum,
+        "avg"   : elow_avg,
+        "min"   : elow_min,
+        "max"   : elow_max,
+        "count" : elow_count,
+    }.items()
+}
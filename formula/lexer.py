@@ -1,6 +1,7 @@
 from typing import List, Optional
 
 from .token import *
+from .expr import expr_error_messages
 
 class Lexer:
     OPERATIONS = ["+", "-", "*", "/"]
@@ -11,6 +12,8 @@ class Lexer:
         ")" : TokenType.r_paren
     }
 
+    ERRORS = set(expr_error_messages.values())
+
     def __init__(self, text: str):
         self.text = text
         self.tokens = []
@@ -27,6 +30,8 @@ class Lexer:
         if self.current_tok:
             if self._is_number(self.current_tok):
                 self.tokens.append(Token(TokenType.number, self.current_tok))
+            elif self.current_tok in self.ERRORS:
+                self.tokens.append(Token(TokenType.error, self.current_tok))
             else:
                 self.tokens.append(Token(TokenType.identifier, self.current_tok))
 
@@ -1,11 +1,7 @@
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Tuple
 
 from .token import *
 from .expr import *
-from utils import QueuedIter
-
-class InvalidFormula(BaseException):
-    pass
 
 class Parser:
     OPERATIONS: Dict[str, ExprType] = {
@@ -14,12 +10,29 @@ class Parser:
         "*" : ExprType.mul,
         "/" : ExprType.div,
     }
-    HIGHER_OPERATIONS: List[str] = ["*", "/"]
-    LOWER_OPERATIONS: List[str] = ["+", "-"]
+    PRECEDENCES: Dict[str, int] = {
+        "+" : 1,
+        "-" : 1,
+        "*" : 2,
+        "/" : 2,
+    }
+
+    ERRORS: Dict[str, ExprErrorType] = {message : error for error, message in expr_error_messages.items()}
 
     def __init__(self, tokens: List[Token]):
-        self.tokens: QueuedIter[Union[Token, Expr]] = QueuedIter(tokens)
-        self.new_tokens: List[Union[Token, Expr]] = []
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self) -> Optional[Token]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def _next_token(self) -> Token:
+        if self.position >= len(self.tokens):
+            raise InvalidFormula
+        self.position += 1
+        return self.tokens[self.position-1]
 
     def _expect(self, token_type: TokenType) -> Token:
         token = self._next_token()
@@ -27,16 +40,10 @@ class Parser:
             raise InvalidFormula
         return token
 
-    def _next_token(self) -> Token | Expr:
-        try:
-            return next(self.tokens)
-        except StopIteration:
-            raise InvalidFormula
-    
-    def _parse_number(self, token: Token):
-        self.new_tokens.append(Expr(token.value, ExprType.constant, value=float(token.value)))
+    def _parse_number(self, token: Token) -> Expr:
+        return Expr(token.value, ExprType.constant, value=float(token.value))
 
-    def _parse_cell(self, token: Token):
+    def _parse_coords(self) -> Tuple[str, int, int]:
         col = self._expect(TokenType.number)
         self._expect(TokenType.colon)
         row = self._expect(TokenType.number)
@@ -44,106 +51,88 @@ class Parser:
         x, y = float(col.value), float(row.value)
         if not x.is_integer() or not y.is_integer():
             raise InvalidFormula
-        
-        self.new_tokens.append(Expr(f":{col.value}:{row.value}", ExprType.cell, value=(int(x), int(y))))
 
-    def _parse_operation(self, token: Token):
-        try:
-            left = self.new_tokens[-1]
-            self.new_tokens = self.new_tokens[:-1]
-        except IndexError:
-            raise InvalidFormula
-        right = self._next_token()
-        if not (isinstance(left, Expr) and isinstance(right, Expr)):
-            raise InvalidFormula
-        self.new_tokens.append(Expr(
-            left.text + token.value + right.text,
-            self.OPERATIONS[token.value], [left, right]
-        ))
+        return f":{col.value}:{row.value}", int(x), int(y)
+
+    def _parse_cell(self, token: Token) -> Expr:
+        text, x, y = self._parse_coords()
+        next_token = self._peek()
+        if next_token is None or next_token.type != TokenType.colon:
+            return Expr(text, ExprType.cell, value=(x, y))
+
+        # Range :x1:y1::x2:y2, the second colon starts the end cell
+        self.position += 1
+        self._expect(TokenType.colon)
+        end_text, end_x, end_y = self._parse_coords()
+        return Expr(
+            f"{text}:{end_text}", ExprType.range,
+            value=(min(x, end_x), min(y, end_y), max(x, end_x), max(y, end_y))
+        )
+
+    def _parse_error(self, token: Token) -> Expr:
+        return Expr(token.value, ExprType.error, value=self.ERRORS[token.value])
 
-    def _parse_function(self, token: Token):
+    def _parse_function(self, token: Token) -> Expr:
         self._expect(TokenType.l_paren)
         args = []
-        first_arg = self._next_token() 
-        has_args = first_arg.type != TokenType.r_paren
-        if has_args:
-            self.tokens.add(first_arg)
-        if has_args:
+        next_token = self._peek()
+        if next_token is not None and next_token.type == TokenType.r_paren:
+            self.position += 1
+        else:
             while True:
-                [arg, *rest] = Parser(list(self.tokens)).parse(end=[TokenType.comma, TokenType.r_paren])
-                self.tokens.__init__(rest)
-                args.append(arg)
+                args.append(self._parse_expr())
                 if self._next_token().type == TokenType.r_paren:
                     break
-        self.new_tokens.append(Expr(
+                self.position -= 1
+                self._expect(TokenType.comma)
+
+        return Expr(
             f"{token.value}({', '.join([arg.text for arg in args])})",
             ExprType.func, args, token.value
-        ))
+        )
 
-    def _parse_parens(self, token: Token):
-        [expr, *rest] = Parser(list(self.tokens)).parse(end=[TokenType.r_paren])
-        self.tokens.__init__(rest[1:])
+    def _parse_parens(self, token: Token) -> Expr:
+        expr = self._parse_expr()
+        self._expect(TokenType.r_paren)
         expr.text = f"({expr.text})"
-        self.new_tokens.append(expr)
+        return expr
+
+    PRIMARIES: Dict[TokenType, "function"] = {
+        TokenType.identifier : _parse_function,
+        TokenType.colon : _parse_cell, 
+        TokenType.number : _parse_number,
+        TokenType.l_paren : _parse_parens,
+        TokenType.error : _parse_error,
+    }
 
-    def _parse_higher_operation(self, token: Token):
-        if token.value in self.HIGHER_OPERATIONS:
-            self._parse_operation(token)
-        else:
-            self.new_tokens.append(token)
+    def _parse_primary(self) -> Expr:
+        token = self._next_token()
+        if token.type not in self.PRIMARIES:
+            raise InvalidFormula
+        return self.PRIMARIES[token.type](self, token)
 
-    def _parse_lower_operation(self, token: Token):
-        if token.value in self.LOWER_OPERATIONS:
-            self._parse_operation(token)
-        else:
-            self.new_tokens.append(token)
-
-    ITERATIONS: List[Dict[TokenType, "function"]] = [
-        {
-            TokenType.identifier : _parse_function,
-            TokenType.colon : _parse_cell, 
-            TokenType.number : _parse_number,
-            TokenType.l_paren : _parse_parens,
-        },
-        {TokenType.operation : _parse_higher_operation},
-        {TokenType.operation : _parse_lower_operation},
-    ]
-
-    def parse(self, is_main: bool = False, end: List[str] = []) -> Expr | List[Expr]:
+    def _parse_expr(self, min_precedence: int = 1) -> Expr:
         """
-        Returns Expr if is_main = False, otherwise returns List[Expr]
+        Precedence climbing: operations binding weaker than min_precedence are left to the caller
         """
-        first = self._next_token()
-        if first.type in end:
+        left = self._parse_primary()
+        while True:
+            token = self._peek()
+            if token is None or token.type != TokenType.operation:
+                return left
+            precedence = self.PRECEDENCES[token.value]
+            if precedence < min_precedence:
+                return left
+
+            self.position += 1
+            right = self._parse_expr(precedence + 1)
+            left = Expr(
+                left.text + token.value + right.text,
+                self.OPERATIONS[token.value], [left, right]
+            )
+
+    def parse(self) -> Expr:
+        expr = self._parse_expr()
+        if self.position != len(self.tokens):
             raise InvalidFormula
-        self.tokens.add(first)
-
-        for it, iteration in enumerate(self.ITERATIONS):
-            for token in self.tokens:
-                if isinstance(token, Expr):
-                    self.new_tokens.append(token)
-                    continue
-                if token.type in end:
-                    self.new_tokens.extend([token, *self.tokens])
-                    break
-
-                if token.type not in iteration:
-                    self.new_tokens.append(token)
-                else:
-                    iteration[token.type](self, token)
-            else:
-                if end:
-                    raise InvalidFormula
-            self.tokens = QueuedIter(self.new_tokens.copy())
-            self.new_tokens = []
-
-
-        if is_main:
-            final_tokens = list(self.tokens)
-
-            if len(final_tokens) != 1:
-                raise InvalidFormula
-
-            return final_tokens[0]
-        else:
-            return list(self.tokens)
\ No newline at end of file
+        return expr
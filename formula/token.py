@@ -9,6 +9,7 @@ class TokenType(Enum):
     colon = auto()
     l_paren = auto()
     r_paren = auto()
+    error = auto()
 
 @dataclass
 class Token:
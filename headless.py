@@ -0,0 +1,156 @@
+"""
+Batch evaluation without curses: python main.py eval FILE... [--out PATH | --out-dir DIR] [--format csv|jsonl] [--jobs N]
+and conversion between formats: python main.py convert SOURCE DEST
+"""
+import argparse
+import json
+import os
+import sys
+
+from typing import List, Optional, TextIO, Union
+
+import profiler
+
+from table import Table, delimiter_for, write_atomically
+from storage import TEXT
+from formula.expr import ExprErrorType, expr_error_messages
+
+FORMATS = ["csv", "jsonl"]
+
+def cell_result(table: Table, x: int, y: int, cell_type: int, value: object) -> Union[float, str]:
+    if cell_type == TEXT:
+        return value
+    result = table.value_at(x, y)
+    if isinstance(result, ExprErrorType):
+        return expr_error_messages[result]
+    return result
+
+def _csv_value(result: Union[float, str]) -> str:
+    if isinstance(result, str):
+        return result
+    if float(result).is_integer():
+        return str(int(result))
+    return repr(result)
+
+def write_csv(table: Table, out: TextIO):
+    table.write_delimited(out, ",", lambda x, y, cell_type, value:
+        _csv_value(cell_result(table, x, y, cell_type.value, value)))
+
+def write_jsonl(table: Table, out: TextIO, file_name: str):
+    for y, row in table.storage.iter_rows():
+        for x, cell_type, value in row:
+            out.write(json.dumps({
+                "file" : file_name, "x" : x, "y" : y,
+                "value" : cell_result(table, x, y, cell_type.value, value)
+            }) + "\n")
+
+def evaluate_file(file_name: str, out: TextIO, out_format: str, jobs: int = 1):
+    table = Table.load(file_name)
+    if jobs == 1:
+        table.recalculate_all()
+    else:
+        from parallel import recalculate_parallel
+        recalculate_parallel(table, jobs or None)
+    if out_format == "csv":
+        write_csv(table, out)
+    else:
+        write_jsonl(table, out, file_name)
+
+def _guess_format(args: argparse.Namespace) -> str:
+    if args.format is not None:
+        return args.format
+    if args.out is not None and os.path.splitext(args.out)[1].lstrip(".") in FORMATS:
+        return os.path.splitext(args.out)[1].lstrip(".")
+    return "csv"
+
+def _jobs(text: str) -> int:
+    if not text.isdigit():
+        raise argparse.ArgumentTypeError(f"{text!r} is not a count of processes, 0 or more")
+    return int(text)
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="main.py eval", 
+        description="Evaluate every formula of *.elow files and write computed values")
+    parser.add_argument("files", nargs="+", help="*.elow files to evaluate")
+    out = parser.add_mutually_exclusive_group()
+    out.add_argument("-o", "--out", help="file to write results to, stdout by default")
+    out.add_argument("--out-dir", help="directory to write a result file per input into")
+    parser.add_argument("-f", "--format", choices=FORMATS, default=None,
+        help="output format, guessed from --out extension, csv by default")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="PATH",
+        help="write a JSON report of where time went to PATH, stderr without PATH")
+    parser.add_argument("-j", "--jobs", type=_jobs, default=1,
+        help="evaluate independent formulas in this many processes, 0 uses every core")
+    args = parser.parse_args(argv)
+    args.format = _guess_format(args)
+    if args.format == "csv" and args.out_dir is None and len(args.files) > 1:
+        parser.error("csv output of several files needs --out-dir")
+    return args
+
+def _evaluate_into(file_name: str, args: argparse.Namespace, shared_out: TextIO):
+    """
+    Writes results into shared_out or into a file of their own in --out-dir, which is removed on failure
+    """
+    if args.out_dir is None:
+        evaluate_file(file_name, shared_out, args.format, args.jobs)
+        return
+
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    out_name = os.path.join(args.out_dir, f"{stem}.{args.format}")
+    try:
+        with open(out_name, "w", newline="", encoding="utf-8") as out:
+            evaluate_file(file_name, out, args.format, args.jobs)
+    except BaseException:
+        os.remove(out_name)
+        raise
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    profile = profiler.enable_from_env(args.profile)
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    shared_out = sys.stdout if args.out is None else open(args.out, "w", newline="", encoding="utf-8")
+    status = 0
+    try:
+        for file_name in args.files:
+            if not os.path.exists(file_name):
+                print(f"{file_name}: no such file", file=sys.stderr)
+                status = 1
+                continue
+
+            # A bad file fails alone, the rest of the batch is still evaluated
+            try:
+                _evaluate_into(file_name, args, shared_out)
+            except SystemExit: # The loader reported an invalid file already
+                status = 1
+            except Exception as e:
+                print(f"{file_name}: {e.__class__.__name__}: {e}", file=sys.stderr)
+                status = 1
+    finally:
+        if shared_out is not sys.stdout:
+            shared_out.close()
+
+    if profile is not None and profile.dump_to is None:
+        json.dump(profile.to_dict(), sys.stderr, indent=2)
+        print(file=sys.stderr)
+
+    return status
+
+def convert(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="main.py convert",
+        description="Convert between *.elow and *.csv/*.tsv, the format is chosen by extension")
+    parser.add_argument("source", help="file to read")
+    parser.add_argument("dest", help="file to write")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if not os.path.exists(args.source):
+        print(f"{args.source}: no such file", file=sys.stderr)
+        return 1
+
+    if os.path.splitext(args.source)[1].lower() == ".elow":
+        Table.load(args.source).export_to(args.dest)
+        return 0
+
+    with open(args.source, newline="", encoding="utf-8") as source:
+        write_atomically(args.dest, lambda f: Table.convert_delimited(source, f, delimiter_for(args.source)))
+    return 0
@@ -0,0 +1,74 @@
+"""
+Undo and redo of table edits. Edits are kept as the operations undoing and redoing them,
+which hold only the cells the edit overwrote, never a copy of the table. Undoing an edit
+costs about as much as the edit did, old edits are forgotten once the history
+takes more memory than allowed.
+"""
+from collections import deque
+from typing import Deque, Iterable, List
+
+from cell import CellType
+from storage import StoredCell
+
+MAX_SIZE = 64 << 20 # Estimated bytes of recorded cells, by default
+CELL_SIZE = 100 # Estimated bytes of a recorded cell besides its text
+
+def cells_size(cells: Iterable[StoredCell]) -> int:
+    """
+    Estimated memory taken by recorded cells. Formulas share their parsed templates,
+    so only the cell itself counts
+    """
+    return sum(CELL_SIZE + (len(value) if cell_type == CellType.text else 0) for _, _, cell_type, value in cells)
+
+class Change:
+    __slots__ = ("undo", "redo", "size")
+
+    def __init__(self, undo: "function", redo: "function", size: int):
+        self.undo = undo
+        self.redo = redo
+        self.size = size
+
+class History:
+    def __init__(self, max_size: int = MAX_SIZE):
+        self.max_size = max_size
+        self.done: Deque[Change] = deque()
+        self.undone: List[Change] = []
+        self.size = 0 # Of done and undone changes
+
+    def record(self, undo: "function", redo: "function", size: int = CELL_SIZE):
+        """
+        Remembers an edit, which was just made. Edits undone before it can't be redone anymore
+        """
+        self.size -= sum(change.size for change in self.undone)
+        self.undone.clear()
+        self.done.append(Change(undo, redo, size))
+        self.size += size
+        while self.done and self.size > self.max_size:
+            self.size -= self.done.popleft().size
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self.size = 0
+
+    def undo(self) -> bool:
+        """
+        Undoes the last edit, returns False, when there is nothing to undo
+        """
+        if not self.done:
+            return False
+        change = self.done.pop()
+        change.undo()
+        self.undone.append(change)
+        return True
+
+    def redo(self) -> bool:
+        """
+        Makes the last undone edit again, returns False, when there is nothing to redo
+        """
+        if not self.undone:
+            return False
+        change = self.undone.pop()
+        change.redo()
+        self.done.append(change)
+        return True
@@ -0,0 +1,140 @@
+"""
+Append-only edit journal kept next to a table file as <path>.journal. Every edit is
+appended as a small record and fsynced, the table file itself is only rewritten,
+when the journal is compacted into it.
+"""
+import os
+import struct
+import threading
+import zlib
+
+from typing import Iterator, Optional, Tuple
+
+from cell import Cell, CellType
+from utils import read_length_str
+
+JOURNAL_MAGIC = bytes([0xE]) + bytes("LOWJ", encoding="utf-8")
+COMPACT_SIZE = 4 << 20 # Journal size in bytes, after which it is compacted into the table file
+
+# Record is length: u32 | crc32 of body: u32 | body,
+# body is x: u32 | y: u32 | cell type: u8 | f64 for numbers, length prefixed utf-8 for texts and formulas
+_record_struct = struct.Struct("<II")
+_cell_struct = struct.Struct("<IIB")
+_number_struct = struct.Struct("<d")
+
+def journal_path(path: str) -> str:
+    return path + ".journal"
+
+def _serialize_edit(x: int, y: int, cell: Cell) -> bytes:
+    body = bytearray(_cell_struct.pack(x, y, cell.type.value))
+    if cell.type == CellType.number:
+        body += _number_struct.pack(cell.value)
+    elif cell.type == CellType.text:
+        body += cell.serealize_text_cell()
+    elif cell.type == CellType.formula:
+        body += cell.serealize_formula_cell()
+    return _record_struct.pack(len(body), zlib.crc32(body)) + body
+
+def read_edits(content: bytes) -> Iterator[Tuple[int, int, CellType, object, int]]:
+    """
+    Yields (x, y, cell type, value, end offset) of every complete record,
+    stops at the first torn or corrupted one
+    """
+    if content[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+        return
+    offset = len(JOURNAL_MAGIC)
+    while offset + _record_struct.size <= len(content):
+        length, checksum = _record_struct.unpack_from(content, offset)
+        start = offset + _record_struct.size
+        body = content[start:start+length]
+        if len(body) != length or zlib.crc32(body) != checksum:
+            return
+
+        x, y, cell_type = _cell_struct.unpack_from(body, 0)
+        cell_type = CellType(cell_type)
+        if cell_type == CellType.number:
+            value = _number_struct.unpack_from(body, _cell_struct.size)[0]
+        elif cell_type == CellType.none:
+            value = None
+        else:
+            value, _ = read_length_str(memoryview(body), _cell_struct.size)
+        offset = start + length
+        yield x, y, cell_type, value, offset
+
+def replay(table: "Table", path: str) -> int:
+    """
+    Applies edits journaled for the table file at path, returns the size of the valid part of the journal
+    """
+    try:
+        with open(journal_path(path), "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return 0
+
+    from formula.cache import parse_formula # Not on startup, most tables have no journal
+
+    end = len(JOURNAL_MAGIC) if content[:len(JOURNAL_MAGIC)] == JOURNAL_MAGIC else 0
+    for x, y, cell_type, value, end in read_edits(content):
+        if cell_type == CellType.formula:
+            value = parse_formula(value)
+        table._store_cell(x, y, Cell(table, cell_type, value))
+    return end
+
+class Journal:
+    """
+    Opt-in journal mode of a table: edits are appended to the journal instead of rewriting the table file.
+    The journal is compacted into the table file in a background thread once it passes compact_size
+    """
+    def __init__(self, table: "Table", compact_size: int = COMPACT_SIZE):
+        self.table = table
+        self.compact_size = compact_size
+        self.lock = threading.Lock() # Held while an edit is applied and while the table file is rewritten
+        self.compaction: Optional[threading.Thread] = None
+
+        self.path = journal_path(table.path)
+        valid = 0
+        if os.path.exists(self.path): # Table.load has replayed it already
+            with open(self.path, "rb") as f:
+                for *_, valid in read_edits(f.read()):
+                    pass
+        self.file = open(self.path, "ab")
+        self.file.truncate(valid) # Drop a record torn by a crash
+        if valid == 0:
+            self._append(JOURNAL_MAGIC)
+        self.size = max(valid, len(JOURNAL_MAGIC))
+
+    def _append(self, data: bytes):
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record(self, x: int, y: int, cell: Cell):
+        record = _serialize_edit(x, y, cell)
+        self._append(record)
+        self.size += len(record)
+        if self.size >= self.compact_size:
+            self.compact_in_background()
+
+    def compact(self):
+        """
+        Rewrites the table file with every edit and empties the journal.
+        Crashing in between is safe, since replaying edits the file already has changes nothing
+        """
+        with self.lock:
+            self.table.save_to(self.table.path)
+            self.file.truncate(len(JOURNAL_MAGIC))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.size = len(JOURNAL_MAGIC)
+
+    def compact_in_background(self):
+        if self.compaction is not None and self.compaction.is_alive():
+            return
+        self.table.storage.load_all() # Lazily loaded rows must not be stored from two threads
+        self.compaction = threading.Thread(target=self.compact, daemon=True)
+        self.compaction.start()
+
+    def close(self):
+        if self.compaction is not None:
+            self.compaction.join()
+        self.file.close()
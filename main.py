@@ -1,17 +1,15 @@
 import sys
 import os
 import argparse
-import curses
 
 from table import *
-from display import *
 from formula.expr import *
-from formula.lexer import Lexer
+from journal import Journal
 
-def render(console, text: str):
-    console.clear()
-    console.refresh()
-    print("".join(["\r\n" if char == "\n" else char for char in text]))
+import history
+import profiler
+
+AUTOSAVE_INTERVAL = 60 # Seconds
 
 # Debugging tools
 def generate_coords_table(size_x: int, size_y: int) -> Table:
@@ -26,6 +24,7 @@ def generate_coords_table(size_x: int, size_y: int) -> Table:
     return table
 
 def generate_lexer_test_table(text: str) -> Table:
+    from formula.lexer import Lexer
     lexer = Lexer(text)
     tokens = lexer.lex()
     table = Table()
@@ -49,41 +48,73 @@ def expr_to_str(expr) -> str:
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
-    parser.add_argument("file", help="*.elow file to open in elow editor")
+    parser.add_argument("file", help="*.elow file to open in elow editor, *.csv and *.tsv are imported")
     parser.add_argument("-c", "--create", action="store_true", default=False, dest="create")
+    parser.add_argument("-j", "--journal", action="store_true", default=False,
+        help="append edits to FILE.journal instead of rewriting the file on save")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="PATH",
+        help=f"measure hot paths, show them with the stats command and write a JSON report to PATH on exit,"
+             f" same as {profiler.ENV_VAR}=PATH")
+    parser.add_argument("--autosave", type=float, default=AUTOSAVE_INTERVAL, metavar="SECONDS",
+        help=f"save edits in the background this often, 0 disables autosave, {AUTOSAVE_INTERVAL:g} by default")
+    parser.add_argument("--undo-memory", type=float, default=history.MAX_SIZE / (1 << 20), metavar="MB",
+        help=f"memory kept for undoing edits, oldest edits are forgotten first, {history.MAX_SIZE >> 20} by default")
     return parser.parse_args(sys.argv[1:])
 
-def load_table() -> Table:
-    args = parse_args()
-    
+def load_table(args: argparse.Namespace) -> Table:
+    delimited = os.path.splitext(args.file)[1].lower() in (".csv", ".tsv", ".tab")
     if args.create and not os.path.exists(args.file):
-        temp_table = Table()
-        temp_table.add_cell()
-        temp_table.save_to(args.file)
+        if delimited:
+            open(args.file, "w").close()
+        else:
+            temp_table = Table()
+            temp_table.add_cell()
+            temp_table.save_to(args.file)
 
-    with open(args.file, "rb") as f:
-        return Table.from_elow(f.read(), args.file)
+    if delimited:
+        # Saving writes *.elow next to the imported file, which must not overwrite another table
+        path = os.path.splitext(args.file)[0] + ".elow"
+        if os.path.exists(path):
+            print(f"{path} exists and would be overwritten by saving {args.file}, open it or move it away",
+                  file=sys.stderr)
+            sys.exit(1)
+        table = Table(path=path)
+        table.history.max_size = 0 # Opening the file is not an edit to undo
+        table.import_from(args.file)
+    else:
+        table = Table.load(args.file)
+        if args.journal:
+            table.journal = Journal(table)
+    table.history.max_size = int(args.undo_memory * (1 << 20))
+    return table
 
-def main(console, table):
+def main(console, table: Table, autosave: float):
+    # Keys are read, when stdin becomes readable, getch must not block the event loop
     console.nodelay(True)
     curses.raw()
     curses.curs_set(0) # Inivisible
 
-    display = Display(TableDisplay(table))
-    render(console, display.render())
-
-    controls = display.get_controls()
-    controls_dict = controls.get_all()
-    while True:
-        inp = console.getch()
-        if inp != curses.ERR:
-            if inp in controls_dict:
-                requests = controls_dict[inp]()
-                if requests:
-                    for req in requests:
-                        req.accept(console, controls, display, render)
-                render(console, display.render())
+    app = App(console, table, autosave)
+    app.display.table_display.resize(*console.getmaxyx())
+    asyncio.run(app.run())
 
 if __name__ == "__main__":
-    table = load_table()
-    curses.wrapper(lambda console: main(console, table))
\ No newline at end of file
+    if sys.argv[1:2] == ["eval"]:
+        import headless
+        sys.exit(headless.main(sys.argv[2:]))
+    if sys.argv[1:2] == ["convert"]:
+        import headless
+        sys.exit(headless.convert(sys.argv[2:]))
+
+    # Editor modules pull in curses and asyncio, so they are imported only after the headless
+    # subcommands had their chance
+    import asyncio
+    import curses
+    from app import App
+    from display import TableDisplay
+
+    args = parse_args()
+    if profiler.enable_from_env(args.profile) is not None:
+        profiler.instrument(TableDisplay, "render", "render")
+    table = load_table(args)
+    curses.wrapper(lambda console: main(console, table, args.autosave))
\ No newline at end of file
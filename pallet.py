@@ -1,25 +1,105 @@
-from typing import Dict
+import csv
+
+from typing import Dict, Optional, Tuple
+
+import profiler
 
 from request import TextBoxRequest
+from formula.expr import REFERENCE, InvalidFormula
 
 class Pallet:
     def __init__(self, table_display: "TableDisplay"):
         self.table_display = table_display
 
     def get_request(self) -> TextBoxRequest:
-        return TextBoxRequest(on_finish = lambda text: self._on_finish(text))
+        return TextBoxRequest(on_finish = self._on_finish, status="Running command")
 
-    def _save_command(self):
-        self.table_display.table.save_to(self.table_display.table.path)
+    def _save_command(self, *_):
+        self.table_display.table.save()
 
-    def _exit_command(self):
+    def _exit_command(self, *_):
         exit()
 
+    def _import_command(self, path: str, cursor: Tuple[int, int]):
+        if path:
+            try:
+                self.table_display.table.import_from(path, cursor)
+            except OSError as e:
+                self.table_display.show_message(f"Can't import {path}: {e.strerror or e}")
+            except (UnicodeDecodeError, csv.Error) as e:
+                self.table_display.show_message(f"Can't import {path}: {e}")
+
+    def _export_command(self, path: str, _: Tuple[int, int]):
+        if path:
+            try:
+                self.table_display.table.export_to(path)
+            except OSError as e:
+                self.table_display.show_message(f"Can't export {path}: {e.strerror or e}")
+
+    def _count(self, argument: str, usage: str) -> Optional[int]:
+        """
+        Positive amount given to a command, 1 by default. Shows usage and returns None otherwise
+        """
+        if not argument:
+            return 1
+        if argument.isdigit() and int(argument) > 0:
+            return int(argument)
+        self.table_display.show_message(usage)
+        return None
+
+    def _insert_rows_command(self, argument: str, cursor: Tuple[int, int]):
+        count = self._count(argument, "Usage: insert-rows [N]")
+        if count is not None:
+            self.table_display.table.insert_rows(cursor[1], count)
+
+    def _delete_rows_command(self, argument: str, cursor: Tuple[int, int]):
+        count = self._count(argument, "Usage: delete-rows [N]")
+        if count is not None:
+            self.table_display.table.delete_rows(cursor[1], count)
+
+    def _insert_columns_command(self, argument: str, cursor: Tuple[int, int]):
+        count = self._count(argument, "Usage: insert-columns [N]")
+        if count is not None:
+            self.table_display.table.insert_columns(cursor[0], count)
+
+    def _delete_columns_command(self, argument: str, cursor: Tuple[int, int]):
+        count = self._count(argument, "Usage: delete-columns [N]")
+        if count is not None:
+            self.table_display.table.delete_columns(cursor[0], count)
+
+    def _fill_command(self, argument: str, cursor: Tuple[int, int]):
+        corner, _, text = argument.partition(" ")
+        match = REFERENCE.fullmatch(corner)
+        if match is None:
+            self.table_display.show_message("Usage: fill :x:y [text], fills cells from the cursor to :x:y")
+            return
+        try:
+            self.table_display.table.fill(*cursor, int(match[1]), int(match[2]), text)
+        except InvalidFormula:
+            self.table_display.show_message("Invalid formula")
+
+    def _stats_command(self, *_):
+        if self.table_display.status is not None:
+            self.table_display.show_status(None)
+        elif profiler.profile is None:
+            self.table_display.show_status(f"Profiling is off, start with --profile or {profiler.ENV_VAR}=1")
+        else:
+            self.table_display.show_status(profiler.profile.status())
+
     COMMANDS: Dict[str, "function"] = {
-        "save" : _save_command,
-        "exit" : _exit_command,
+        "save"           : _save_command,
+        "exit"           : _exit_command,
+        "import"         : _import_command, # import <path>, *.csv or *.tsv placed at the cursor
+        "export"         : _export_command, # export <path>
+        "stats"          : _stats_command, # Shows or hides profiling summary
+        "insert-rows"    : _insert_rows_command, # insert-rows [N], inserted above the cursor
+        "delete-rows"    : _delete_rows_command, # delete-rows [N], from the cursor down
+        "insert-columns" : _insert_columns_command, # insert-columns [N], inserted left of the cursor
+        "delete-columns" : _delete_columns_command, # delete-columns [N], from the cursor right
+        "fill"           : _fill_command, # fill :x:y [text], formulas are copied with moving references
     }
 
-    def _on_finish(self, text: str):
-        if text.strip() in self.COMMANDS:
-            self.COMMANDS[text.strip()](self)
\ No newline at end of file
+    def _on_finish(self, text: str, cursor: Tuple[int, int]):
+        name, _, argument = text.strip().partition(" ")
+        if name in self.COMMANDS:
+            self.COMMANDS[name](self, argument.strip(), cursor)
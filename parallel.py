@@ -0,0 +1,121 @@
+"""
+Opt-in parallel recalculation. Formula cells are split into independent groups
+(connected components of the dependency graph), which are evaluated in worker
+processes. Workers get only formula texts and the values they read, never the table.
+"""
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from cell import Cell, CellType
+from table import Table
+from dependencies import Coords
+from storage import CHUNK_BITS, EMPTY, FORMULA
+from formula.expr import MaybeFloat
+from formula.cache import parse_formula
+
+InputCell = Tuple[int, int, int, object] # x, y, type tag, value
+FormulaCell = Tuple[int, int, str] # x, y, formula text
+
+# Below this amount of formulas starting processes costs more than it saves
+MIN_PARALLEL_FORMULAS = 1000
+
+class _UnionFind:
+    def __init__(self):
+        self.parents: Dict[Coords, Coords] = {}
+
+    def find(self, cell: Coords) -> Coords:
+        root = cell
+        while self.parents.setdefault(root, root) != root:
+            root = self.parents[root]
+        while cell != root:
+            self.parents[cell], cell = root, self.parents[cell]
+        return root
+
+    def union(self, a: Coords, b: Coords):
+        self.parents[self.find(a)] = self.find(b)
+
+def _range_cells(table: Table, bounds: Tuple[int, int, int, int]):
+    for x, block, chunk, start, stop in table.storage.iter_range(*bounds):
+        for index in range(start, stop):
+            if chunk.types[index] != EMPTY:
+                yield x, (block << CHUNK_BITS) + index, chunk.types[index]
+
+def components(table: Table) -> List[List[Coords]]:
+    """
+    Groups formula cells so that formulas of different groups never read each other
+    """
+    formulas = set(table.storage.iter_formulas())
+    groups = _UnionFind()
+    for formula in formulas:
+        groups.find(formula)
+        for precedent in table.dependencies.precedents.get(formula, ()):
+            if precedent in formulas:
+                groups.union(formula, precedent)
+        for bounds in table.dependencies.range_precedents.get(formula, ()):
+            for x, y, cell_type in _range_cells(table, bounds):
+                if cell_type == FORMULA:
+                    groups.union(formula, (x, y))
+
+    res: Dict[Coords, List[Coords]] = {}
+    for formula in formulas:
+        res.setdefault(groups.find(formula), []).append(formula)
+    return list(res.values())
+
+def _pack(table: Table, group: List[Coords]) -> Tuple[List[FormulaCell], List[InputCell]]:
+    formulas = []
+    inputs: Dict[Coords, InputCell] = {}
+
+    def add_input(x: int, y: int):
+        stored = table.storage.get(x, y)
+        if stored is not None and stored[0] != CellType.formula:
+            # Formulas only need to know, that a text is a text
+            value = stored[1] if stored[0] == CellType.number else ""
+            inputs[(x, y)] = (x, y, stored[0].value, value)
+
+    for x, y in group:
+        formulas.append((x, y, table.storage.get(x, y)[1].text))
+        for precedent in table.dependencies.precedents.get((x, y), ()):
+            add_input(*precedent)
+        for bounds in table.dependencies.range_precedents.get((x, y), ()):
+            for cell_x, cell_y, cell_type in _range_cells(table, bounds):
+                if cell_type != FORMULA and (cell_x, cell_y) not in inputs:
+                    add_input(cell_x, cell_y)
+
+    return formulas, list(inputs.values())
+
+def _evaluate(packed: List[Tuple[List[FormulaCell], List[InputCell]]]) -> List[Tuple[int, int, MaybeFloat]]:
+    res = []
+    for formulas, inputs in packed:
+        table = Table()
+        for x, y, cell_type, value in inputs:
+            table.storage.set(x, y, CellType(cell_type), value)
+        for x, y, text in formulas:
+            table._store_cell(x, y, Cell(table, CellType.formula, parse_formula(text)))
+        table.recalculate_all()
+        res.extend((x, y, table.value_at(x, y)) for x, y, _ in formulas)
+    return res
+
+def recalculate_parallel(table: Table, workers: Optional[int] = None):
+    """
+    Evaluates every formula like Table.recalculate_all, spreading independent groups over processes
+    """
+    workers = workers or os.cpu_count() or 1
+    groups = components(table)
+    if workers == 1 or len(groups) == 1 or sum(map(len, groups)) < MIN_PARALLEL_FORMULAS:
+        table.recalculate_all()
+        return
+
+    # Biggest groups first, each goes to the least loaded batch
+    batches: List[List[Tuple[List[FormulaCell], List[InputCell]]]] = [[] for _ in range(workers * 4)]
+    loads = [0] * len(batches)
+    for group in sorted(groups, key=len, reverse=True):
+        batch = loads.index(min(loads))
+        batches[batch].append(_pack(table, group))
+        loads[batch] += len(group)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_evaluate, [batch for batch in batches if batch]):
+            for x, y, value in results:
+                table.storage.set_result(x, y, value)
@@ -0,0 +1,159 @@
+"""
+Opt-in instrumentation of hot paths. Nothing is measured unless enable() is called, which wraps
+the instrumented functions, so a disabled profiler costs nothing.
+Enabled by ELOW_PROFILE environment variable or --profile, either may name a file,
+which gets the report in JSON when the process exits.
+"""
+import atexit
+import functools
+import json
+import os
+import time
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dependencies import Coords
+
+ENV_VAR = "ELOW_PROFILE"
+TOP_FORMULAS = 10
+
+class Counter:
+    __slots__ = ("calls", "seconds", "bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def to_dict(self) -> Dict[str, float]:
+        res = {"calls" : self.calls, "seconds" : self.seconds}
+        if self.bytes:
+            res["bytes"] = self.bytes
+            res["bytes_per_second"] = self.bytes / self.seconds if self.seconds else 0.0
+        return res
+
+class Profile:
+    def __init__(self, dump_to: Optional[str] = None):
+        self.dump_to = dump_to # File, which gets the report on exit
+        self.counters: Dict[str, Counter] = {}
+        self.formulas: Dict[Coords, Counter] = {} # Evaluation time of a formula without its precedents
+        self.texts: Dict[Coords, str] = {}
+        self._children: List[float] = [] # Time spent evaluating precedents of formulas being evaluated
+
+    def counter(self, name: str) -> Counter:
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = Counter()
+        return counter
+
+    def top_formulas(self, count: int = TOP_FORMULAS) -> List[Tuple[Coords, Counter]]:
+        return sorted(self.formulas.items(), key=lambda item: item[1].seconds, reverse=True)[:count]
+
+    def to_dict(self, count: int = TOP_FORMULAS) -> dict:
+        return {
+            "counters" : {name: counter.to_dict() for name, counter in self.counters.items()},
+            "top_formulas" : [{"x" : x, "y" : y, "formula" : self.texts.get((x, y), ""), **counter.to_dict()}
+                for (x, y), counter in self.top_formulas(count)],
+        }
+
+    def status(self) -> str:
+        """
+        One line summary for the status line
+        """
+        parts = []
+        for name, counter in self.counters.items():
+            parts.append(f"{name} {counter.calls}x {counter.seconds*1000:.1f}ms")
+        top = self.top_formulas(1)
+        if top:
+            (x, y), counter = top[0]
+            parts.append(f"slowest :{x}:{y} {counter.seconds*1000:.1f}ms")
+        return " | ".join(parts) if parts else "Nothing measured yet"
+
+    def dump(self, file_name: str):
+        with open(file_name, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
+
+profile: Optional[Profile] = None
+
+def instrument(owner: type, name: str, counter_name: str, size: Optional[Callable[..., int]] = None):
+    """
+    Wraps owner.name to count its calls and time, size gets the call arguments and returns processed bytes
+    """
+    attribute = owner.__dict__[name]
+    wrap_classmethod = isinstance(attribute, classmethod)
+    original = attribute.__func__ if wrap_classmethod else attribute
+    counter = profile.counter(counter_name)
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            counter.seconds += time.perf_counter() - start
+            counter.calls += 1
+            if size is not None:
+                counter.bytes += size(*args, **kwargs)
+
+    setattr(owner, name, classmethod(wrapper) if wrap_classmethod else wrapper)
+
+def _instrument_evaluation(table_class: type):
+    original = table_class._evaluate
+    counter = profile.counter("evaluate")
+    formulas, texts, children = profile.formulas, profile.texts, profile._children
+
+    @functools.wraps(original)
+    def _evaluate(table, x: int, y: int, formula):
+        children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original(table, x, y, formula)
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - children.pop()
+            if children:
+                children[-1] += elapsed
+            timing = formulas.get((x, y))
+            if timing is None:
+                timing = formulas[(x, y)] = Counter()
+                texts[(x, y)] = formula.text
+            timing.calls += 1
+            timing.seconds += own
+            counter.calls += 1
+            counter.seconds += own
+
+    table_class._evaluate = _evaluate
+
+def enable(dump_to: Optional[str] = None) -> Profile:
+    """
+    Starts measuring lexing, parsing, formula evaluation, loading and saving
+    """
+    global profile
+    if profile is not None:
+        return profile
+    profile = Profile(dump_to)
+
+    from table import Table, _RowIndex
+    from formula.lexer import Lexer
+    from formula.parser import Parser
+    instrument(Lexer, "lex", "lex")
+    instrument(Parser, "parse", "parse")
+    _instrument_evaluation(Table)
+    instrument(Table, "from_elow", "load", size=lambda cls, content, path: len(content))
+    instrument(_RowIndex, "load_block", "load rows")
+    instrument(Table, "save_to", "save", size=lambda table, file_name: os.path.getsize(file_name))
+
+    if dump_to:
+        atexit.register(profile.dump, dump_to)
+    return profile
+
+def enable_from_env(flag: Optional[str] = None) -> Optional[Profile]:
+    """
+    Enables profiling, when --profile was given (flag is its value) or ELOW_PROFILE is set,
+    values other than "" and "1" are file names to dump the report to
+    """
+    value = flag if flag is not None else os.environ.get(ENV_VAR)
+    if value is None or value == "0":
+        return None
+    return enable(None if value in ("", "1") else value)
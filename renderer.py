@@ -0,0 +1,87 @@
+import curses
+
+from typing import List, Optional, Tuple
+
+Frame = List[List[Tuple[str, int]]] # Rows of (text, curses attribute) cells separated by a space
+
+class Renderer:
+    """
+    Draws frames on a curses window. The previous frame is kept, so only cells,
+    whose text or attributes changed, are redrawn instead of the whole screen.
+    """
+    def __init__(self, console):
+        self.console = console
+        self.previous: Frame = []
+        self.size = console.getmaxyx()
+
+    def invalidate(self):
+        """
+        Forces a full redraw, for example after something else drew over the screen
+        """
+        self.previous = []
+        self.console.erase()
+
+    def _addstr(self, y: int, x: int, text: str, attr: int):
+        width = self.console.getmaxyx()[1]
+        if x >= width:
+            return
+        try:
+            self.console.addstr(y, x, text[:width-x], attr)
+        except curses.error: # Writing into the bottom right corner moves the cursor out of the window
+            pass
+
+    def _draw_row(self, y: int, row: List[Tuple[str, int]]):
+        self.console.move(y, 0)
+        self.console.clrtoeol()
+        x = 0
+        for text, attr in row:
+            self._addstr(y, x, text, attr)
+            x += len(text) + 1
+
+    def _update_row(self, y: int, row: List[Tuple[str, int]], old: List[Tuple[str, int]]):
+        # Cells only keep their positions, when every cell before them kept its width
+        if [len(text) for text, _ in row] != [len(text) for text, _ in old]:
+            self._draw_row(y, row)
+            return
+
+        x = 0
+        for cell, old_cell in zip(row, old):
+            if cell != old_cell:
+                self._addstr(y, x, *cell)
+            x += len(cell[0]) + 1
+
+    def draw(self, frame: Frame):
+        if self.console.getmaxyx() != self.size:
+            self.size = self.console.getmaxyx()
+            self.invalidate()
+        height = self.size[0] - 1 # Last line is left for text boxes
+        frame = frame[:height]
+        for y, row in enumerate(frame):
+            if y >= len(self.previous):
+                self._draw_row(y, row)
+            elif row != self.previous[y]:
+                self._update_row(y, row, self.previous[y])
+
+        for y in range(len(frame), len(self.previous)):
+            self.console.move(y, 0)
+            self.console.clrtoeol()
+
+        self.previous = frame
+        self.console.refresh()
+
+    def draw_line(self, text: str, cursor: Optional[int] = None):
+        """
+        Draws text on the last line, which frames leave free, and puts the cursor at cursor
+        """
+        height, width = self.console.getmaxyx()
+        # Long texts are scrolled, so the cursor stays visible
+        start = 0 if cursor is None else max(cursor - width + 2, 0)
+        self.console.move(height-1, 0)
+        self.console.clrtoeol()
+        self._addstr(height-1, 0, text[start:], curses.A_NORMAL)
+        if cursor is not None:
+            self.console.move(height-1, min(cursor - start, width-1))
+        self.console.refresh()
+
+    def render(self, console, frame: Frame):
+        self.draw(frame)
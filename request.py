@@ -1,5 +1,4 @@
 import curses
-from curses import textpad
 from typing import Dict
 
 
@@ -18,33 +17,58 @@ class Controls:
         )
 
 
+class CommandRequest:
+    """
+    Starts function on the table worker thread with status shown, while input stays responsive
+    """
+    def __init__(self, function: "function", status: str):
+        self.function = function
+        self.status = status
+
+    async def accept(self, app: "App") -> "asyncio.Task":
+        return app.start_job(self.function, self.status)
+
+
 class TextBoxRequest:
-    def __init__(self, on_finish=None):
-        self.on_finish = on_finish if on_finish is not None else lambda _: None
-
-    def _controls_validator(self, char, controls: Dict[int, "function"], console,
-                            display: "Display", render: "function") -> int:
-        if char == ord("\n"):
-            curses.curs_set(0) # Inivisible
-            return 7
-        elif char in controls:
-            ret = controls[char]()
-            render(console, display.render())
-            if not isinstance(ret, int) and ret is not None:
-                assert False, "Unreachable, requests can't process a request"
-            if ret is None:
-                return 7
-            else:
-                return ret
-
-        return char
-
-    def accept(self, console, controls: Controls, display: "Display", render: "function"):
-        print("\r\n")
-        curses.curs_set(1) # Normal
-        textbox = textpad.Textbox(console, insert_mode=True)
-        self.on_finish(
-            textbox.edit(
-                lambda char: self._controls_validator(char, controls.always_on, console, display, render),
-            ).removesuffix(" \n")
-        )
\ No newline at end of file
+    def __init__(self, on_finish=None, status: str = "Working"):
+        self.on_finish = on_finish if on_finish is not None else lambda text, cursor: None
+        self.status = status
+
+    async def read_text(self, app: "App") -> str:
+        # Text is typed on the last line, which is never used by the table
+        text, cursor = "", 0
+        while True:
+            app.show_text_box(text, cursor)
+            char = await app.next_key()
+            if char in (ord("\n"), ord("\r"), curses.KEY_ENTER):
+                break
+            elif char in app.controls.always_on:
+                app.controls.always_on[char]()
+            elif char in (curses.KEY_BACKSPACE, 127, 8):
+                if cursor:
+                    text, cursor = text[:cursor-1] + text[cursor:], cursor-1
+            elif char == curses.KEY_DC:
+                text = text[:cursor] + text[cursor+1:]
+            elif char == curses.KEY_LEFT:
+                cursor = max(cursor-1, 0)
+            elif char == curses.KEY_RIGHT:
+                cursor = min(cursor+1, len(text))
+            elif char in (curses.KEY_HOME, 1): # ctrl + A
+                cursor = 0
+            elif char in (curses.KEY_END, 5): # ctrl + E
+                cursor = len(text)
+            elif 32 <= char < 127:
+                text, cursor = text[:cursor] + chr(char) + text[cursor:], cursor+1
+
+        app.show_text_box(None)
+        return text.rstrip(" ")
+
+    async def accept(self, app: "App") -> "asyncio.Task":
+        """
+        Returns once the text is typed, the returned task finishes, when on_finish is done.
+        on_finish gets the text and the table cursor, when the text was entered, since keys
+        move the cursor on, while the job waits for the worker
+        """
+        text = await self.read_text(app)
+        cursor = app.table.cursor
+        return app.start_job(lambda: self.on_finish(text, cursor), self.status)
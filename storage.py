@@ -0,0 +1,340 @@
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from cell import CellType
+from formula.expr import MaybeFloat
+
+CHUNK_BITS = 8
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+EMPTY = 0 # Type tag of a cell, which was never filled
+NUMBER = CellType.number.value
+TEXT = CellType.text.value
+FORMULA = CellType.formula.value
+
+StoredCell = Tuple[int, int, CellType, object] # x, y, type, value
+
+_cell_types: List[Optional[CellType]] = [None] + [cell_type for cell_type in CellType]
+
+class Chunk:
+    """
+    CHUNK_SIZE consecutive cells of a single column stored column-wise:
+    type tags in a byte array, numbers in a contiguous array of doubles,
+    texts and formulas in a side table and cached formula results in another one
+    """
+    __slots__ = ("types", "numbers", "objects", "results", "displays", "count", "number_count", "shared")
+
+    def __init__(self):
+        self.types = bytearray(CHUNK_SIZE)
+        self.numbers: Optional[array] = None # Allocated with the first number
+        self.objects: Dict[int, object] = {}
+        self.results: Dict[int, MaybeFloat] = {}
+        self.displays: Dict[int, str] = {} # Memoized displayed strings, dropped with results
+        self.count = 0
+        self.number_count = 0
+        self.shared = False # Also referenced by a snapshot, so it is copied before being modified
+
+    def copy(self) -> "Chunk":
+        res = Chunk.__new__(Chunk)
+        res.types = bytearray(self.types)
+        res.numbers = None if self.numbers is None else array("d", self.numbers)
+        res.objects = dict(self.objects)
+        res.results = dict(self.results)
+        res.displays = dict(self.displays)
+        res.count = self.count
+        res.number_count = self.number_count
+        res.shared = False
+        return res
+
+class CellStorage:
+    """
+    Sparse cell storage. Every column is split into chunks of CHUNK_SIZE rows
+    and only chunks, which hold at least one non-empty cell, are allocated,
+    so memory scales with the amount of populated cells.
+    """
+    def __init__(self):
+        self.columns: Dict[int, Dict[int, Chunk]] = {}
+        self.blocks: Dict[int, Set[int]] = {} # Chunk index -> columns, which have that chunk
+        self.count = 0
+        self.pending: Set[int] = set() # Chunk indices, which were not read from the file yet
+        self.loader: Optional[Callable[[int], None]] = None
+
+    def defer(self, blocks: Iterable[int], loader: Callable[[int], None]):
+        """
+        Marks rows of the chunks as not loaded, loader stores them on first access
+        """
+        self.pending.update(blocks)
+        self.loader = loader
+
+    def _load(self, block: int):
+        self.pending.discard(block)
+        loader = self.loader
+        if not self.pending:
+            self.loader = None
+        loader(block)
+
+    def load_all(self):
+        for block in sorted(self.pending):
+            self._load(block)
+
+    def chunk_at(self, x: int, y: int) -> Optional[Chunk]:
+        if self.pending and y >> CHUNK_BITS in self.pending:
+            self._load(y >> CHUNK_BITS)
+        column = self.columns.get(x)
+        if column is None:
+            return None
+        return column.get(y >> CHUNK_BITS)
+
+    def get(self, x: int, y: int) -> Optional[Tuple[CellType, object]]:
+        chunk = self.chunk_at(x, y)
+        if chunk is None:
+            return None
+        index = y & CHUNK_MASK
+        cell_type = chunk.types[index]
+        if cell_type == EMPTY:
+            return None
+        if cell_type == NUMBER:
+            return CellType.number, chunk.numbers[index]
+        return _cell_types[cell_type], chunk.objects[index]
+
+    def set(self, x: int, y: int, cell_type: CellType, value: object):
+        """
+        Stores the cell, storing an empty cell removes whatever was stored at (x, y)
+        """
+        if cell_type == CellType.none:
+            self._remove(x, y)
+            return
+
+        block = y >> CHUNK_BITS
+        if self.pending and block in self.pending:
+            self._load(block)
+        column = self.columns.setdefault(x, {})
+        chunk = column.get(block)
+        if chunk is None:
+            chunk = column[block] = Chunk()
+            self.blocks.setdefault(block, set()).add(x)
+        elif chunk.shared:
+            chunk = column[block] = chunk.copy()
+
+        index = y & CHUNK_MASK
+        old_type = chunk.types[index]
+        if old_type == EMPTY:
+            chunk.count += 1
+            self.count += 1
+        elif old_type == NUMBER:
+            chunk.number_count -= 1
+        chunk.results.pop(index, None)
+        chunk.displays.pop(index, None)
+
+        if cell_type == CellType.number:
+            if chunk.numbers is None:
+                chunk.numbers = array("d", bytes(8 * CHUNK_SIZE))
+            chunk.numbers[index] = value
+            chunk.number_count += 1
+            chunk.objects.pop(index, None)
+        else:
+            if old_type == NUMBER:
+                chunk.numbers[index] = 0.0
+            chunk.objects[index] = value
+        chunk.types[index] = cell_type.value
+
+    def _remove(self, x: int, y: int):
+        block = y >> CHUNK_BITS
+        if self.pending and block in self.pending:
+            self._load(block)
+        column = self.columns.get(x)
+        chunk = None if column is None else column.get(block)
+        index = y & CHUNK_MASK
+        if chunk is None or chunk.types[index] == EMPTY:
+            return
+        if chunk.shared:
+            chunk = column[block] = chunk.copy()
+
+        if chunk.types[index] == NUMBER:
+            chunk.numbers[index] = 0.0
+            chunk.number_count -= 1
+        chunk.types[index] = EMPTY
+        chunk.objects.pop(index, None)
+        chunk.results.pop(index, None)
+        chunk.displays.pop(index, None)
+        chunk.count -= 1
+        self.count -= 1
+        if chunk.count == 0:
+            del column[block]
+            if not column:
+                del self.columns[x]
+            self.blocks[block].discard(x)
+            if not self.blocks[block]:
+                del self.blocks[block]
+
+    def cells_in(self, x1: int, y1: int, x2: int, y2: int) -> List[StoredCell]:
+        """
+        Non-empty cells of the rectangle
+        """
+        res = []
+        for x, block, chunk, start, stop in self.iter_range(x1, y1, x2, y2):
+            for index in range(start, stop):
+                cell_type = chunk.types[index]
+                if cell_type == NUMBER:
+                    res.append((x, (block << CHUNK_BITS) + index, CellType.number, chunk.numbers[index]))
+                elif cell_type != EMPTY:
+                    res.append((x, (block << CHUNK_BITS) + index, _cell_types[cell_type], chunk.objects[index]))
+        return res
+
+    def clear(self, x1: int, y1: int, x2: int, y2: int) -> List[StoredCell]:
+        """
+        Removes every cell of the rectangle, returns the removed cells
+        """
+        cells = self.cells_in(x1, y1, x2, y2)
+        for x, y, _, _ in cells:
+            self._remove(x, y)
+        return cells
+
+    def move_rows(self, y: int, dy: int) -> List[Tuple[int, int]]:
+        """
+        Moves every cell at row y and below by dy rows onto rows, which must be empty.
+        Returns former coordinates of moved formulas, their cached results are dropped
+        """
+        self.load_all() # Rows read later would land on their old places
+        cells = []
+        for x, column in self.columns.items():
+            for block in [block for block in column if block >= y >> CHUNK_BITS]:
+                chunk = column[block]
+                for index in range(max(y - (block << CHUNK_BITS), 0), CHUNK_SIZE):
+                    cell_type = chunk.types[index]
+                    if cell_type == NUMBER:
+                        cells.append((x, (block << CHUNK_BITS) + index, cell_type, chunk.numbers[index]))
+                    elif cell_type != EMPTY:
+                        cells.append((x, (block << CHUNK_BITS) + index, cell_type, chunk.objects[index]))
+
+        for x, row, _, _ in cells:
+            self._remove(x, row)
+        for x, row, cell_type, value in cells:
+            self.set(x, row + dy, _cell_types[cell_type], value)
+        return [(x, row) for x, row, cell_type, _ in cells if cell_type == FORMULA]
+
+    def move_columns(self, x: int, dx: int) -> List[Tuple[int, int]]:
+        """
+        Moves every column from x on by dx columns onto columns, which must be empty.
+        Chunks are moved as a whole. Returns former coordinates of moved formulas,
+        their cached results are dropped
+        """
+        self.load_all()
+        moved = {column_x : self.columns.pop(column_x) for column_x in [key for key in self.columns if key >= x]}
+        formulas = []
+        for column_x, column in moved.items():
+            for block, chunk in column.items():
+                self.blocks[block].discard(column_x)
+                if chunk.shared:
+                    chunk = column[block] = chunk.copy()
+                chunk.results.clear()
+                chunk.displays.clear()
+                formulas.extend((column_x, (block << CHUNK_BITS) + index)
+                                for index in chunk.objects if chunk.types[index] == FORMULA)
+        for column_x, column in moved.items():
+            self.columns[column_x + dx] = column
+            for block in column:
+                self.blocks[block].add(column_x + dx)
+        return formulas
+
+    def snapshot(self) -> "CellStorage":
+        """
+        Read only copy of the storage, chunks are shared until the storage modifies them
+        """
+        self.load_all()
+        res = CellStorage()
+        for x, column in self.columns.items():
+            for chunk in column.values():
+                chunk.shared = True
+            res.columns[x] = dict(column)
+        res.blocks = {block: set(columns) for block, columns in self.blocks.items()}
+        res.count = self.count
+        return res
+
+    def invalidate(self, x: int, y: int):
+        chunk = self.chunk_at(x, y)
+        if chunk is not None:
+            chunk.results.pop(y & CHUNK_MASK, None)
+            chunk.displays.pop(y & CHUNK_MASK, None)
+
+    def invalidate_all(self):
+        """
+        Drops every cached formula result, like invalidate for every formula
+        """
+        for column in self.columns.values():
+            for chunk in column.values():
+                for index in chunk.results:
+                    chunk.displays.pop(index, None)
+                chunk.results.clear()
+
+    def set_result(self, x: int, y: int, result: MaybeFloat):
+        """
+        Caches a formula result computed elsewhere
+        """
+        chunk = self.chunk_at(x, y)
+        if chunk is not None and chunk.types[y & CHUNK_MASK] == FORMULA:
+            chunk.results[y & CHUNK_MASK] = result
+            chunk.displays.pop(y & CHUNK_MASK, None)
+
+    def iter_rows(self) -> Iterator[Tuple[int, List[Tuple[int, CellType, object]]]]:
+        """
+        Yields populated rows in order as (y, [(x, cell_type, value), ...]) with cells ordered by x
+        """
+        self.load_all()
+        for block in sorted(self.blocks):
+            chunks = [(x, self.columns[x][block]) for x in sorted(self.blocks[block])]
+            for offset in range(CHUNK_SIZE):
+                row = []
+                for x, chunk in chunks:
+                    cell_type = chunk.types[offset]
+                    if cell_type == NUMBER:
+                        row.append((x, CellType.number, chunk.numbers[offset]))
+                    elif cell_type != EMPTY:
+                        row.append((x, _cell_types[cell_type], chunk.objects[offset]))
+                if row:
+                    yield (block << CHUNK_BITS) + offset, row
+
+    def iter_formulas(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields coordinates of every formula cell
+        """
+        self.load_all()
+        for x, column in self.columns.items():
+            for block, chunk in column.items():
+                if FORMULA in chunk.types:
+                    for index in chunk.objects:
+                        if chunk.types[index] == FORMULA:
+                            yield x, (block << CHUNK_BITS) + index
+
+    def iter_range(self, x1: int, y1: int, x2: int, y2: int) -> Iterator[Tuple[int, int, Chunk, int, int]]:
+        """
+        Yields allocated chunks intersecting the rectangle as (x, chunk index, chunk, start, stop),
+        where start and stop delimit the part of the chunk inside of it
+        """
+        if self.pending:
+            for block in sorted(block for block in self.pending if y1 >> CHUNK_BITS <= block <= y2 >> CHUNK_BITS):
+                self._load(block)
+        if x2 - x1 < len(self.columns):
+            columns = (x for x in range(x1, x2+1) if x in self.columns)
+        else:
+            columns = sorted(x for x in self.columns if x1 <= x <= x2)
+        first, last = y1 >> CHUNK_BITS, y2 >> CHUNK_BITS
+
+        for x in columns:
+            column = self.columns[x]
+            if last - first < len(column):
+                blocks = range(first, last+1)
+            else:
+                blocks = sorted(block for block in column if first <= block <= last)
+            for block in blocks:
+                chunk = column.get(block)
+                if chunk is None:
+                    continue
+                start = y1 - (block << CHUNK_BITS) if block == first else 0
+                stop = y2 - (block << CHUNK_BITS) + 1 if block == last else CHUNK_SIZE
+                yield x, block, chunk, start, stop
+
+    def __len__(self) -> int:
+        self.load_all()
+        return self.count
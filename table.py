@@ -1,10 +1,89 @@
-from typing import List, Dict, Tuple
+import csv
+import io
+import itertools
+import mmap
+import os
+import stat
+import struct
+import sys
+import threading
+
+from array import array
+from bisect import bisect_left
+
+from typing import BinaryIO, Callable, Iterable, Iterator, Dict, List, Optional, Sequence, Set, TextIO, Tuple, Union
 
 from cell import Cell, CellType
-from utils import next_bytes
+from dependencies import DependencyGraph, Coords
+from storage import CellStorage, StoredCell, CHUNK_BITS, CHUNK_MASK, EMPTY, NUMBER, TEXT, FORMULA
+from formula.expr import REFERENCE, Expr, Formula, MaybeFloat, ExprErrorType, InvalidFormula, shift_text
+from journal import Journal, journal_path, replay
+from history import CELL_SIZE, History, cells_size
 
 MAGIC = bytes([0xE]) + bytes("LOW", encoding="utf-8")
 
+# Version 1 files are MAGIC followed by cell records, new lines are 0 bytes.
+# Since version 2 MAGIC is followed by VERSION_MARKER (never a cell type) and the version.
+# Version 2 layout:
+#   header | rows | ys: u32[row_count] | offsets: u64[row_count] | index offset: u64 | row_count: u32
+# Row is u32 run count followed by runs of cells of one type with consecutive x:
+#   x: u32 | cell type: u8 | length: u32 | f64[length] for numbers, cell records otherwise
+VERSION_MARKER = 0xFF
+FORMAT_VERSION = 2
+HEADER = MAGIC + bytes([VERSION_MARKER, FORMAT_VERSION])
+
+# Below this amount of formulas to recalculate importing NumPy costs more than it saves
+MIN_VECTORIZED_FORMULAS = 10000
+
+_trailer_struct = struct.Struct("<QI")
+_run_struct = struct.Struct("<IBI")
+
+Row = List[Tuple[int, CellType, object]]
+
+def _little_endian(numbers: array) -> array:
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    return numbers
+
+def _read_array(typecode: str, content: memoryview, offset: int, length: int) -> Tuple[array, int]:
+    res = array(typecode)
+    res.frombytes(content[offset:offset + res.itemsize*length])
+    return _little_endian(res), offset + res.itemsize*length
+
+def _file_mode(file_name: str) -> int:
+    try:
+        return stat.S_IMODE(os.stat(file_name).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def delimiter_for(file_name: str) -> str:
+    """
+    Tab for *.tsv and *.tab files, comma for everything else
+    """
+    return "\t" if os.path.splitext(file_name)[1].lower() in (".tsv", ".tab") else ","
+
+def write_atomically(file_name: str, write: Callable[[BinaryIO], None]):
+    """
+    Writes into a temporary file next to file_name and replaces it atomically,
+    so a failed write never leaves a half written file behind
+    """
+    import tempfile # Pulls in shutil and random, only saves need it
+
+    directory = os.path.dirname(os.path.abspath(file_name))
+    fd, temp_name = tempfile.mkstemp(prefix=".elow-", suffix=".tmp", dir=directory)
+    try:
+        with open(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_name, _file_mode(file_name))
+        os.replace(temp_name, file_name)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
 class Table:
     _cell_parsers: Dict[CellType, "function"] = {
         CellType.none   .value : Cell.parse_none_cell,
@@ -21,66 +100,668 @@ class Table:
     }
 
     def __init__(self, path: str = "out.elow"):
-        self.version = -1
-        self.rows: List[List[Cell]] = []
+        self.storage = CellStorage()
         self.cursor: Tuple[int, int] = (0, 0)
         self.path = path
+        self.dependencies = DependencyGraph()
+        self.empty_cell = Cell(self)
+        self.journal: Optional[Journal] = None
+        self.edits = 0 # Amount of edits, edits up to saved_edits are saved
+        self.saved_edits = 0
+        self.saving: Optional[threading.Thread] = None
+        self.save_error: Optional[Exception] = None # Of the last background save, which failed
+        self.history = History()
 
     def _add_cell(self, cell: Cell):
-        if len(self.rows) <= self.cursor[1]:
-            self.rows.extend([[] for _ in range(len(self.rows)-self.cursor[1]+1)]) 
-        self.rows[self.cursor[1]].insert(self.cursor[0]+1, cell)  
+        self._store_cell(*self.cursor, cell)
         self.cursor = (self.cursor[0]+1, self.cursor[1])
 
     def add_cell(self, cell_type: CellType = CellType.none, value: object = None):
         return self._add_cell(Cell(self, cell_type, value))
 
+    def _store_cell(self, x: int, y: int, cell: Cell):
+        self.storage.set(x, y, cell.type, cell.value)
+        if cell.type == CellType.formula:
+            self.dependencies.set_precedents((x, y), cell.value.references(), cell.value.ranges())
+        else:
+            self.dependencies.remove((x, y))
+
+    def get_cell(self, x: int, y: int) -> Cell:
+        """
+        Returns cell at (x, y), cells, which were never filled, share one empty cell
+        """
+        stored = self.storage.get(x, y)
+        if stored is None:
+            return self.empty_cell
+        return Cell(self, *stored, (x, y))
+
+    def value_at(self, x: int, y: int) -> MaybeFloat:
+        """
+        Value of a cell for formulas, formula results are cached until the cell is invalidated
+        """
+        chunk = self.storage.chunk_at(x, y)
+        if chunk is None:
+            return 0.0
+        index = y & CHUNK_MASK
+        cell_type = chunk.types[index]
+        if cell_type == NUMBER:
+            return chunk.numbers[index]
+        if cell_type == FORMULA:
+            result = chunk.results.get(index)
+            if result is None:
+                result = self._evaluate_with_precedents(x, y)
+            return result
+        if cell_type == TEXT:
+            return ExprErrorType.cell_type_error
+        return 0.0
+
+    def _evaluate(self, x: int, y: int, formula: Formula) -> MaybeFloat:
+        return formula.template.compiled(self, formula.dx, formula.dy)
+
+    def _pending_precedents(self, x: int, y: int) -> Iterator[Coords]:
+        """
+        Formulas read by the formula at (x, y), which have no cached result
+        """
+        for precedent_x, precedent_y in self.dependencies.precedents.get((x, y), ()):
+            chunk = self.storage.chunk_at(precedent_x, precedent_y)
+            index = precedent_y & CHUNK_MASK
+            if chunk is not None and chunk.types[index] == FORMULA and index not in chunk.results:
+                yield precedent_x, precedent_y
+
+        for bounds in self.dependencies.range_precedents.get((x, y), ()):
+            for range_x, block, chunk, start, stop in self.storage.iter_range(*bounds):
+                if chunk.types.find(FORMULA, start, stop) == -1:
+                    continue
+                for index in range(start, stop):
+                    if chunk.types[index] == FORMULA and index not in chunk.results:
+                        yield range_x, (block << CHUNK_BITS) + index
+
+    def _evaluate_with_precedents(self, x: int, y: int) -> MaybeFloat:
+        """
+        Evaluates the formula at (x, y) after the formulas it reads. Precedents are walked depth first
+        with an explicit stack, so chains are not limited by the recursion limit,
+        and formulas on a cycle get cycle_error instead of recursing forever
+        """
+        stack = [((x, y), self._pending_precedents(x, y))]
+        on_stack = {(x, y)}
+        while stack:
+            cell, precedents = stack[-1]
+            for precedent in precedents:
+                if precedent in on_stack:
+                    for cycle_cell, _ in reversed(stack):
+                        chunk = self.storage.chunk_at(*cycle_cell)
+                        chunk.results[cycle_cell[1] & CHUNK_MASK] = ExprErrorType.cycle_error
+                        if cycle_cell == precedent:
+                            break
+                    continue
+                chunk = self.storage.chunk_at(*precedent)
+                if (precedent[1] & CHUNK_MASK) not in chunk.results:
+                    stack.append((precedent, self._pending_precedents(*precedent)))
+                    on_stack.add(precedent)
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(cell)
+                chunk = self.storage.chunk_at(*cell)
+                index = cell[1] & CHUNK_MASK
+                if index not in chunk.results:
+                    chunk.results[index] = self._evaluate(*cell, chunk.objects[index])
+
+        return self.storage.chunk_at(x, y).results[y & CHUNK_MASK]
+
+    def _evaluate_ordered(self, x: int, y: int):
+        """
+        Evaluates a formula without looking for pending precedents, since in a topological order
+        they were evaluated already, other cells are skipped
+        """
+        chunk = self.storage.chunk_at(x, y)
+        index = y & CHUNK_MASK
+        if chunk is not None and chunk.types[index] == FORMULA and index not in chunk.results:
+            chunk.results[index] = self._evaluate(x, y, chunk.objects[index])
+
+    def display_at(self, x: int, y: int) -> str:
+        """
+        Displayed string of a cell, memoized until the cell or its formula result changes
+        """
+        chunk = self.storage.chunk_at(x, y)
+        if chunk is None:
+            return str(self.empty_cell)
+        index = y & CHUNK_MASK
+        text = chunk.displays.get(index)
+        if text is None:
+            text = str(self.get_cell(x, y))
+            if chunk.types[index] != EMPTY:
+                chunk.displays[index] = text
+        return text
+
+    def range_values(self, x1: int, y1: int, x2: int, y2: int) -> Union[List[Sequence[float]], ExprErrorType]:
+        """
+        Values of the rectangle grouped in contiguous blocks, empty cells are skipped.
+        Parts of chunks holding only numbers are returned as slices of the stored numbers
+        without looking at separate cells.
+        """
+        blocks: List[Sequence[float]] = []
+        for x, block, chunk, start, stop in self.storage.iter_range(x1, y1, x2, y2):
+            types = chunk.types[start:stop]
+            numbers = types.count(NUMBER)
+            if numbers == stop - start:
+                blocks.append(chunk.numbers[start:stop])
+                continue
+            if numbers + types.count(EMPTY) == stop - start:
+                if numbers:
+                    blocks.append(list(itertools.compress(chunk.numbers[start:stop], types)))
+                continue
+
+            values = []
+            for index, cell_type in enumerate(types, start):
+                if cell_type == NUMBER:
+                    values.append(chunk.numbers[index])
+                elif cell_type == FORMULA:
+                    value = self.value_at(x, (block << CHUNK_BITS) + index)
+                    if isinstance(value, ExprErrorType):
+                        return value
+                    values.append(value)
+                elif cell_type == TEXT:
+                    return ExprErrorType.cell_type_error
+            blocks.append(values)
+
+        return blocks
+
+    def _set_cell(self, x: int, y: int, cell: Cell):
+        if self.journal is None:
+            self._store_cell(x, y, cell)
+        else:
+            with self.journal.lock:
+                self._store_cell(x, y, cell)
+                self.journal.record(x, y, cell)
+        self.edits += 1
+        self.recalculate([(x, y)])
+
+    def set_cell(self, x: int, y: int, cell: Cell):
+        old = self.get_cell(x, y)
+        self._set_cell(x, y, cell)
+        self.history.record(lambda: self._set_cell(x, y, old), lambda: self._set_cell(x, y, cell))
+
+    def _evaluate_vectorized(self, formulas: Set[Coords]) -> Set[Coords]:
+        """
+        Evaluates runs of copied down formulas with NumPy, when there are enough formulas
+        to pay for importing it, returns formulas, which are left to evaluate
+        """
+        if len(formulas) < MIN_VECTORIZED_FORMULAS:
+            return formulas
+        from vectorized import evaluate_runs
+        evaluated = evaluate_runs(self, formulas)
+        return formulas - evaluated if evaluated else formulas
+
+    def recalculate(self, changed: Iterable[Coords]):
+        """
+        Recomputes formulas, which depend on changed cells, leaving every other cached value alone
+        """
+        dirty = self.dependencies.transitive_dependents(changed)
+        for x, y in dirty:
+            self.storage.invalidate(x, y)
+
+        dirty = self._evaluate_vectorized(dirty)
+        for x, y in self.dependencies.topological_order(dirty):
+            self._evaluate_ordered(x, y)
+
+    def recalculate_all(self):
+        """
+        Evaluates every formula once, in dependency order
+        """
+        formulas = set(self.storage.iter_formulas())
+        self.storage.invalidate_all()
+        formulas = self._evaluate_vectorized(formulas)
+        for x, y in self.dependencies.topological_order(formulas):
+            self._evaluate_ordered(x, y)
+        # Formulas on cycles are left out of the order
+        for x, y in formulas:
+            self.value_at(x, y)
+
+    def _bulk_edit(self, edit: Callable[[], Iterable[Coords]]):
+        """
+        Applies an edit of many cells, which returns changed cells. Journals record single cells,
+        so with a journal the table file is rewritten instead
+        """
+        if self.journal is None:
+            changed = edit()
+        else:
+            with self.journal.lock:
+                changed = edit()
+        self.edits += 1
+        self.recalculate(changed)
+        if self.journal is not None:
+            self.journal.compact()
+
+    def _restore(self, cells: Iterable[StoredCell], bounds: Optional[Tuple[int, int, int, int]] = None) -> List[Coords]:
+        """
+        Stores recorded cells after clearing bounds, returns changed cells
+        """
+        changed = []
+        if bounds is not None:
+            for x, y, cell_type, _ in self.storage.clear(*bounds):
+                if cell_type == CellType.formula:
+                    self.dependencies.remove((x, y))
+                changed.append((x, y))
+        for x, y, cell_type, value in cells:
+            self._store_cell(x, y, Cell(self, cell_type, value))
+            changed.append((x, y))
+        return changed
+
+    def _move_cells(self, start: int, count: int, rows: bool, overwritten: List[StoredCell]) -> Set[Coords]:
+        """
+        Inserts count empty rows (or columns) before start, negative count deletes -count
+        of them from start on. Formulas reading moved or deleted cells are found through
+        the dependency index and rewritten, returns cells, which have to be recalculated.
+        Deleted cells and formulas as they were before being rewritten are added to overwritten,
+        moving the cells back and storing them undoes the move
+        """
+        from formula.cache import parse_formula # Only sheets with formulas have references to rewrite
+        from formula.expr import move_references
+
+        # Formulas of rows, which were not read yet, are missing from the dependency index
+        self.storage.load_all()
+        deleted = max(-count, 0)
+        def moved(x: int, y: int) -> Coords:
+            position = y if rows else x
+            if position >= start:
+                position += count
+            return (x, position) if rows else (position, y)
+
+        dependencies = self.dependencies
+        referencing = dependencies.referencing_rows(start) if rows else dependencies.referencing_columns(start)
+        changed: Set[Coords] = set()
+        if deleted:
+            last = start + deleted - 1
+            if rows:
+                columns = self.storage.columns
+                removed = self.storage.clear(min(columns, default=0), start, max(columns, default=0), last)
+            else:
+                blocks = self.storage.blocks
+                removed = self.storage.clear(start, 0, last, ((max(blocks, default=0) + 1) << CHUNK_BITS) - 1)
+            overwritten.extend(removed)
+            removed = [(x, y) for x, y, cell_type, _ in removed if cell_type == CellType.formula]
+            for cell in removed:
+                dependencies.remove(cell)
+            referencing.difference_update(removed)
+            changed.update(removed)
+
+        if rows:
+            formulas = self.storage.move_rows(start + deleted, count)
+        else:
+            formulas = self.storage.move_columns(start + deleted, count)
+        for cell in formulas:
+            dependencies.remove(cell)
+        formulas = {moved(*cell) for cell in formulas}
+
+        shiftable: Dict[Expr, bool] = {}
+        for referencing_coords in referencing:
+            x, y = moved(*referencing_coords)
+            formula = self.storage.get(x, y)[1]
+            template = formula.template
+            if template not in shiftable:
+                references, ranges = template.referenced()
+                shiftable[template] = len(REFERENCE.findall(template.text)) == len(references) + 2 * len(ranges)
+            # Formulas reading only moved cells, like most of a column of copied down formulas,
+            # move along with them and keep their template
+            if shiftable[template] and min(itertools.chain(
+                    (cell[rows] for cell in formula.references()),
+                    (bounds[rows] for bounds in formula.ranges()))) >= start + deleted:
+                shifted = Formula(template, formula.dx, formula.dy + count) if rows else \
+                    Formula(template, formula.dx + count, formula.dy)
+                self.storage.set(x, y, CellType.formula, shifted)
+                formulas.add((x, y))
+                continue
+
+            text = move_references(formula.text, rows, start, count)
+            if text != formula.text:
+                overwritten.append((*referencing_coords, CellType.formula, formula))
+                self.storage.set(x, y, CellType.formula, parse_formula(text))
+                formulas.add((x, y))
+
+        for x, y in formulas:
+            formula = self.storage.get(x, y)[1]
+            dependencies.set_precedents((x, y), formula.references(), formula.ranges())
+        changed.update(formulas)
+        return changed
+
+    def _move(self, start: int, count: int, rows: bool):
+        overwritten: List[StoredCell] = []
+        self._bulk_edit(lambda: self._move_cells(start, count, rows, overwritten))
+        # Moving back costs as much as moving did, only cells lost by the move are kept
+        undo = lambda: self._move_cells(start, -count, rows, []) | set(self._restore(overwritten))
+        redo = lambda: self._move_cells(start, count, rows, [])
+        self.history.record(lambda: self._bulk_edit(undo), lambda: self._bulk_edit(redo), cells_size(overwritten))
+
+    def insert_rows(self, y: int, count: int = 1):
+        self._move(y, count, rows=True)
+
+    def delete_rows(self, y: int, count: int = 1):
+        self._move(y, -count, rows=True)
+
+    def insert_columns(self, x: int, count: int = 1):
+        self._move(x, count, rows=False)
+
+    def delete_columns(self, x: int, count: int = 1):
+        self._move(x, -count, rows=False)
+
+    def _fill(self, x1: int, y1: int, x2: int, y2: int, cell: Cell) -> List[Coords]:
+        changed = [(x, y) for y in range(y1, y2+1) for x in range(x1, x2+1)]
+        if cell.type != CellType.formula or cell.value.template.referenced() == ([], []):
+            for x, y in changed:
+                self._store_cell(x, y, cell)
+            return changed
+
+        from formula.cache import parse_formula
+        text = cell.value.text
+        for x, y in changed:
+            formula = parse_formula(shift_text(text, x - x1, y - y1))
+            self._store_cell(x, y, Cell(self, CellType.formula, formula))
+        return changed
+
+    def fill(self, x1: int, y1: int, x2: int, y2: int, text: str):
+        """
+        Sets every cell of the rectangle to text typed into its top left cell. Formulas are copied
+        with references moving along, like a formula copied down a column. Raises InvalidFormula
+        """
+        cell = Cell.from_text(self, text)
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        overwritten = self.storage.cells_in(x1, y1, x2, y2)
+        fill = lambda: self._bulk_edit(lambda: self._fill(x1, y1, x2, y2, cell))
+        fill()
+        self.history.record(lambda: self._bulk_edit(lambda: self._restore(overwritten, (x1, y1, x2, y2))),
+                            fill, cells_size(overwritten))
+
     def move_cursor(self, dx: int, dy: int):
-        self.cursor = (self.cursor[0]+dx, self.cursor[1]+dy)
-        
-        if self.cursor[0] < 0: 
-            self.cursor = (0, self.cursor[1])
-        if self.cursor[1] < 0: 
-            self.cursor = (self.cursor[0], 0)
-        
-        if self.cursor[1] >= len(self.rows):
-            self.rows.extend(
-                [[Cell(self) for _ in range(self.cursor[0])]
-                    for _ in range(self.cursor[1] - len(self.rows) + 1)])
-
-        if self.cursor[0] >= len(self.rows[self.cursor[1]]):
-            self.rows[self.cursor[1]].extend(
-                [Cell(self) for _ in 
-                    range(self.cursor[0] - len(self.rows[self.cursor[1]]) + 1)]
-            )
+        self.cursor = (max(self.cursor[0]+dx, 0), max(self.cursor[1]+dy, 0))
+
+    def _serialize_row(self, row: Row) -> bytearray:
+        serializers = self._cell_serializers
+        runs: List[Row] = []
+        for cell in row:
+            last = runs[-1][-1] if runs else None
+            if last is not None and last[0] + 1 == cell[0] and last[1] == cell[1]:
+                runs[-1].append(cell)
+            else:
+                runs.append([cell])
+
+        row_bytes = bytearray(len(runs).to_bytes(4, "little"))
+        for run in runs:
+            cell_type = run[0][1]
+            row_bytes += _run_struct.pack(run[0][0], cell_type.value, len(run))
+            if cell_type == CellType.number:
+                row_bytes += _little_endian(array("d", [value for _, _, value in run])).tobytes()
+            else:
+                for _, _, value in run:
+                    row_bytes += serializers[cell_type](Cell(self, cell_type, value))
+        return row_bytes
+
+    def _write_rows(self, file: BinaryIO, rows: Iterable[Tuple[int, Row]]):
+        file.write(HEADER)
+        offset = len(HEADER)
+        ys, offsets = array("I"), array("Q")
+        for y, row in rows:
+            row_bytes = self._serialize_row(row)
+            ys.append(y)
+            offsets.append(offset)
+            file.write(row_bytes)
+            offset += len(row_bytes)
+        file.write(_little_endian(ys).tobytes())
+        file.write(_little_endian(offsets).tobytes())
+        file.write(_trailer_struct.pack(offset, len(ys)))
+
+    def write_elow(self, file: BinaryIO):
+        """
+        Streams table into a binary file row by row, so only one row and the row index are kept in memory
+        """
+        self._write_rows(file, self.storage.iter_rows())
+
+    @staticmethod
+    def _cell_from_field(table: "Table", field: str) -> Cell:
+        try:
+            return Cell.from_text(table, field)
+        except InvalidFormula: # Keep the text rather than losing it
+            return Cell(table, CellType.text, field)
+
+    def write_delimited(self, file: TextIO, delimiter: str = ",",
+                        field: Optional[Callable[[int, int, CellType, object], str]] = None):
+        """
+        Streams cells as CSV/TSV row by row. Fields are cell sources, formulas keep their "\\f " prefix,
+        unless field gives the text of a cell from its coordinates, type and stored value
+        """
+        if field is None:
+            field = lambda x, y, cell_type, value: Cell(self, cell_type, value, (x, y)).source_text()
+        writer = csv.writer(file, delimiter=delimiter, lineterminator="\n")
+        next_y = 0
+        for y, row in self.storage.iter_rows():
+            for _ in range(y - next_y):
+                writer.writerow([])
+            fields = [""] * (row[-1][0] + 1)
+            for x, cell_type, value in row:
+                fields[x] = field(x, y, cell_type, value)
+            writer.writerow(fields)
+            next_y = y + 1
+
+    def read_delimited(self, file: TextIO, delimiter: str = ",", origin: Coords = (0, 0)):
+        """
+        Stores CSV/TSV rows with the top left field at origin, reading one row at a time.
+        Empty fields clear cells, formulas are evaluated once everything is read.
+        Imports too big for the history can't be undone, nor edits made before them.
+        When reading fails, rows read so far stay stored and can be undone like a whole import
+        """
+        overwritten: List[StoredCell] = []
+        written: List[StoredCell] = []
+        size = 0
+        try:
+            for y, fields in enumerate(csv.reader(file, delimiter=delimiter), origin[1]):
+                for x, field in enumerate(fields, origin[0]):
+                    stored = self.storage.get(x, y)
+                    if field or stored is not None:
+                        cell = self._cell_from_field(self, field)
+                        self._store_cell(x, y, cell)
+                        if size <= self.history.max_size:
+                            overwritten.append((x, y, CellType.none, None) if stored is None else (x, y, *stored))
+                            written.append((x, y, cell.type, cell.value))
+                            size += 2 * CELL_SIZE + len(field)
+        finally:
+            self.edits += 1
+            self.recalculate_all()
+
+            if size > self.history.max_size:
+                self.history.clear()
+            elif written:
+                self.history.record(lambda: self._bulk_edit(lambda: self._restore(overwritten)),
+                                    lambda: self._bulk_edit(lambda: self._restore(written)), size)
+
+    def import_from(self, file_name: str, origin: Coords = (0, 0)):
+        """
+        Raises OSError, UnicodeDecodeError or csv.Error, when the file can't be read
+        """
+        with open(file_name, newline="", encoding="utf-8") as f:
+            try:
+                self.read_delimited(f, delimiter_for(file_name), origin)
+            finally:
+                if self.journal is not None: # Too many edits to journal
+                    self.journal.compact()
+
+    def export_to(self, file_name: str):
+        def write(f: BinaryIO):
+            text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+            self.write_delimited(text, delimiter_for(file_name))
+            text.detach() # Flushes, but leaves f open
+        write_atomically(file_name, write)
+
+    @classmethod
+    def convert_delimited(cls, source: TextIO, file: BinaryIO, delimiter: str = ","):
+        """
+        Writes CSV/TSV straight into *.elow format without building a table,
+        so memory use does not depend on file size
+        """
+        scratch = Table()
+
+        def rows() -> Iterator[Tuple[int, Row]]:
+            for y, fields in enumerate(csv.reader(source, delimiter=delimiter)):
+                row = []
+                for x, field in enumerate(fields):
+                    cell = cls._cell_from_field(scratch, field)
+                    if cell.type != CellType.none:
+                        row.append((x, cell.type, cell.value))
+                if row:
+                    yield y, row
+
+        scratch._write_rows(file, rows())
 
     def to_elow(self) -> bytes:
-        res = MAGIC
-        for row in self.rows:
-            for cell in row:
-                res = res + cell.serealize_cell_type() + self._cell_serializers[cell.type](cell)
-            res = res + bytes([0])
-        return res
+        res = io.BytesIO()
+        self.write_elow(res)
+        return res.getvalue()
 
     def save_to(self, file_name: str):
-        with open(file_name, "wb") as f:
-            f.write(self.to_elow())
+        write_atomically(file_name, self.write_elow)
+
+    def snapshot(self) -> "Table":
+        """
+        Copy of cells for saving, which shares storage chunks with the table until they are edited
+        """
+        res = Table(path=self.path)
+        res.storage = self.storage.snapshot()
+        res.edits = res.saved_edits = self.edits
+        return res
+
+    def save(self, background: bool = False):
+        """
+        Makes edits durable. In journal mode they are on disk already, otherwise the table file is rewritten
+        and the journal, which was replayed on load, is not needed anymore.
+        Background saves write a snapshot from another thread, so editing can go on meanwhile,
+        their errors are kept in save_error instead of being raised
+        """
+        if self.journal is not None:
+            self.saved_edits = self.edits
+            return
+        if self.saving is not None:
+            self.saving.join() # Saves must not overtake each other
+
+        snapshot = self.snapshot() if background else self
+        edits = self.edits
+        def save():
+            snapshot.save_to(self.path)
+            if os.path.exists(journal_path(self.path)):
+                os.remove(journal_path(self.path))
+            # Only edits, which are on disk, count as saved, so failed saves are retried
+            self.saved_edits = edits
+
+        def save_in_background():
+            try:
+                save()
+            except Exception as e:
+                self.save_error = e
+
+        if background:
+            self.saving = threading.Thread(target=save_in_background) # Not a daemon, so exiting waits for it
+            self.saving.start()
+        else:
+            save()
 
     @classmethod
-    def from_elow(cls, file_content: bytes, path: str) -> "Table":
+    def from_elow(cls, file_content: Union[bytes, bytearray, memoryview, mmap.mmap], path: str) -> "Table":
+        """
+        Loads table from *.elow content. Version 2 rows are read lazily, when their chunk
+        is first accessed, so the content has to stay valid as long as the table is loading
+        """
         table = Table(path=path)
-        content = iter(file_content)
 
-        if next_bytes(content, len(MAGIC)) != MAGIC:
-            print("Invalid file")
+        content = memoryview(file_content)
+        if content[:len(MAGIC)] != MAGIC:
+            print(f"{path}: invalid file", file=sys.stderr)
             exit(1) # TODO: Make actually good errors
 
-        for cell_type in content:
-            if cell_type == 0: # New line
-                table.cursor = (table.cursor[0], table.cursor[1]+1)
-            else:
-                cls._cell_parsers[cell_type](table, content)
+        if content[len(MAGIC):len(HEADER)] == HEADER[len(MAGIC):]:
+            _RowIndex(table, content)
+            return table
+        if len(content) > len(MAGIC) and content[len(MAGIC)] == VERSION_MARKER:
+            print(f"{path}: unsupported file version", file=sys.stderr)
+            exit(1)
+
+        with content:
+            offset = len(MAGIC)
+            end = len(content)
+            parsers = cls._cell_parsers
+            x, y = 0, 0
+            while offset < end:
+                cell_type = content[offset]
+                offset += 1
+                if cell_type == 0: # New line
+                    x, y = 0, y + 1
+                    continue
+
+                cell, offset = parsers[cell_type](table, content, offset)
+                if cell.type != CellType.none:
+                    table._store_cell(x, y, cell)
+                x += 1
+
+        return table
+
+    @classmethod
+    def load(cls, source: Union[str, BinaryIO]) -> "Table":
+        """
+        Loads table from a path or a binary file object, mapping the file into memory when possible
+        """
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                table = cls._load_file(f, source)
+            replay(table, source)
+            return table
+        return cls._load_file(source, getattr(source, "name", "out.elow"))
+
+    @classmethod
+    def _load_file(cls, file: BinaryIO, path: str) -> "Table":
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError): # Not a real file, or an empty one
+            return cls.from_elow(file.read(), path)
+
+        table = cls.from_elow(mapped, path)
+        if not table.storage.pending:
+            mapped.close()
+        return table
+
+class _RowIndex:
+    """
+    Row offsets of a version 2 file, rows are stored into the table a chunk at a time
+    """
+    def __init__(self, table: Table, content: memoryview):
+        self.table = table
+        self.content = content
+        index_offset, row_count = _trailer_struct.unpack_from(content, len(content) - _trailer_struct.size)
+        self.ys, offset = _read_array("I", content, index_offset, row_count)
+        self.offsets, _ = _read_array("Q", content, offset, row_count)
+
+        if row_count:
+            table.storage.defer({y >> CHUNK_BITS for y in self.ys}, self.load_block)
+        else:
+            content.release()
+
+    def load_block(self, block: int):
+        table, content = self.table, self.content
+        parsers = table._cell_parsers
+        first = bisect_left(self.ys, block << CHUNK_BITS)
+        last = bisect_left(self.ys, (block + 1) << CHUNK_BITS)
+        for y, offset in zip(self.ys[first:last], self.offsets[first:last]):
+            run_count = int.from_bytes(content[offset:offset+4], "little")
+            offset += 4
+            for _ in range(run_count):
+                x, cell_type, length = _run_struct.unpack_from(content, offset)
+                offset += _run_struct.size
+                if cell_type == NUMBER:
+                    numbers, offset = _read_array("d", content, offset, length)
+                    for x, number in enumerate(numbers, x):
+                        table.storage.set(x, y, CellType.number, number)
+                    continue
 
-        table.cursor = (0, 0)
+                for x in range(x, x + length):
+                    cell, offset = parsers[cell_type](table, content, offset)
+                    table._store_cell(x, y, cell)
 
-        return table
\ No newline at end of file
+        if not table.storage.pending:
+            content.release()
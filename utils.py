@@ -1,41 +1,16 @@
 import struct
 
-from typing import List, Iterator, Generic, TypeVar
+from typing import Tuple
 
-def next_bytes(bytes_iter: Iterator, size: int):
-    return bytes([next(bytes_iter) for _ in range(size)])
+_int_struct = struct.Struct("<I")
+_float_struct = struct.Struct("f")
 
-def next_int(bytes_iter: Iterator, size: int = 4):
-    return int.from_bytes(next_bytes(bytes_iter, size), "little")
+def read_int(buffer: memoryview, offset: int) -> Tuple[int, int]:
+    return _int_struct.unpack_from(buffer, offset)[0], offset+4
 
-def next_float(bytes_iter: Iterator):
-    return struct.unpack("f", next_bytes(bytes_iter, 4))[0]
+def read_float(buffer: memoryview, offset: int) -> Tuple[float, int]:
+    return _float_struct.unpack_from(buffer, offset)[0], offset+4
 
-def next_length_str(bytes_iter: Iterator):
-    return next_bytes(bytes_iter, size=next_int(bytes_iter)).decode("utf-8")
-
-T = TypeVar("T")
-
-class QueuedIter(Generic[T]):
-    def __init__(self, base: List[T]):
-        self._queue = base
-        self._cursor = 0
-
-    def add(self, obj: T):
-        self._queue.insert(self._cursor, obj)
-
-    def current(self) -> T:
-        return self._queue[self._cursor-1]
-
-    def prev(self) -> T:
-        return self._queue[self._cursor-2]
-
-    def __next__(self) -> T:
-        try:
-            self._cursor += 1
-            return self._queue[self._cursor-1]
-        except IndexError:
-            raise StopIteration
-
-    def __iter__(self):
-        return self
\ No newline at end of file
+def read_length_str(buffer: memoryview, offset: int) -> Tuple[str, int]:
+    size, offset = read_int(buffer, offset)
+    return str(buffer[offset:offset+size], encoding="utf-8"), offset+size
@@ -0,0 +1,205 @@
+"""
+Optional NumPy backend of recalculation. Formulas copied down a column share a template
+and differ only by a shift growing with the row, so a run of them is evaluated as one
+array expression over the referenced columns. Errors travel in a parallel mask of
+ExprErrorType values. Runs, which can't be vectorized, are left to the scalar path.
+"""
+import math
+import operator
+
+from typing import Callable, Dict, List, Set, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from table import Table
+from dependencies import Coords
+from storage import CHUNK_BITS, CHUNK_MASK, FORMULA, NUMBER, TEXT
+from formula.expr import Expr, ExprType, ExprErrorType
+
+MIN_RUN = 32 # Shorter runs are cheaper to evaluate cell by cell
+MAX_NESTED = 64 # Runs read by runs are evaluated first, deeper chains are read cell by cell
+
+Run = Tuple[int, int, int, Expr, int, int] # x, first y, length, template, dx, dy of the first formula
+Column = Tuple["numpy.ndarray", "numpy.ndarray"] # Values and error codes, 0 is no error
+
+_errors: Dict[int, ExprErrorType] = {error.value : error for error in ExprErrorType}
+
+class _Fallback(Exception):
+    """
+    The run has to be evaluated by the scalar path
+    """
+
+def vectorizable(expr: Expr) -> bool:
+    if expr.type in (ExprType.cell, ExprType.constant):
+        return True
+    if expr.type == ExprType.func:
+        arity = _functions.get(expr.value, (None, -1))[1]
+        return len(expr.arguments) == arity and all(map(vectorizable, expr.arguments))
+    return expr.type in _operations and all(map(vectorizable, expr.arguments))
+
+def _runs(table: Table, formulas: Set[Coords]) -> List[Run]:
+    """
+    Splits formulas of every column into runs of consecutive rows with the same template,
+    whose shift moves down by one row per row
+    """
+    columns: Dict[int, List[int]] = {}
+    for x, y in formulas:
+        columns.setdefault(x, []).append(y)
+
+    res = []
+    templates: Dict[Expr, bool] = {}
+
+    def add_run(x: int, start: int, stop: int, template: Expr, dx: int, dy: int):
+        if stop - start >= MIN_RUN:
+            if template not in templates:
+                templates[template] = vectorizable(template)
+            if templates[template]:
+                res.append((x, start, stop - start, template, dx, dy + start))
+
+    for x, ys in columns.items():
+        ys.sort()
+        column = table.storage.columns.get(x, {})
+        template = None
+        dx = dy = 0
+        start = previous = block = -1
+        for y in ys:
+            if y >> CHUNK_BITS != block:
+                block = y >> CHUNK_BITS
+                chunk = column.get(block)
+                types, objects = (b"", {}) if chunk is None else (chunk.types, chunk.objects)
+            index = y & CHUNK_MASK
+            # Changed cells come along with the formulas reading them
+            formula = objects.get(index) if index < len(types) and types[index] == FORMULA else None
+            if formula is not None and y == previous + 1 and formula.template is template \
+                    and formula.dx == dx and formula.dy - y == dy:
+                previous = y
+                continue
+
+            if template is not None:
+                add_run(x, start, previous + 1, template, dx, dy)
+            template = None
+            if formula is not None:
+                template, dx, dy = formula.template, formula.dx, formula.dy - y
+                start = previous = y
+        if template is not None:
+            add_run(x, start, previous + 1, template, dx, dy)
+    return res
+
+class _Evaluator:
+    def __init__(self, table: Table, runs: List[Run]):
+        self.table = table
+        self.runs: Dict[int, List[Run]] = {}
+        for run in runs:
+            self.runs.setdefault(run[0], []).append(run)
+        self.done: Set[Run] = set() # Evaluated or given up
+        self.active: Set[Run] = set() # Being evaluated, reading them is a cycle or a chain within a run
+        self.evaluated: Set[Coords] = set()
+
+    def _column(self, x: int, y: int, length: int) -> Column:
+        """
+        Values of length cells from (x, y) down, like Table.value_at gives them to formulas
+        """
+        for run in self.runs.get(x, ()):
+            if run[1] < y + length and y < run[1] + run[2] and run not in self.done:
+                if run in self.active:
+                    raise _Fallback
+                if len(self.active) < MAX_NESTED:
+                    self.evaluate_run(run)
+
+        values = numpy.zeros(length)
+        errors = numpy.zeros(length, dtype=numpy.int8)
+        for _, block, chunk, start, stop in self.table.storage.iter_range(x, y, x, y + length - 1):
+            offset = (block << CHUNK_BITS) + start - y
+            types = numpy.frombuffer(chunk.types, dtype=numpy.uint8)[start:stop]
+            if chunk.numbers is not None:
+                numbers = numpy.frombuffer(chunk.numbers, dtype=numpy.float64)[start:stop]
+                values[offset:offset + stop - start] = numpy.where(types == NUMBER, numbers, 0.0)
+            errors[offset:offset + stop - start][types == TEXT] = ExprErrorType.cell_type_error.value
+            for index in numpy.flatnonzero(types == FORMULA).tolist():
+                index += start
+                result = chunk.results.get(index)
+                if result is None:
+                    result = self.table.value_at(x, (block << CHUNK_BITS) + index)
+                if result.__class__ is ExprErrorType:
+                    errors[(block << CHUNK_BITS) + index - y] = result.value
+                else:
+                    values[(block << CHUNK_BITS) + index - y] = result
+        return values, errors
+
+    def _evaluate(self, expr: Expr, columns: Dict[Tuple[int, int], Column], length: int) -> Column:
+        if expr.type == ExprType.cell:
+            return columns[expr.value]
+        if expr.type == ExprType.constant:
+            return numpy.full(length, expr.value), numpy.zeros(length, dtype=numpy.int8)
+        if expr.type == ExprType.func:
+            arguments = [self._evaluate(arg, columns, length) for arg in expr.arguments]
+            errors = numpy.zeros(length, dtype=numpy.int8)
+            # Scalar functions give the error of their first failed argument
+            for _, arg_errors in reversed(arguments):
+                errors = numpy.where(arg_errors != 0, arg_errors, errors)
+            return _functions[expr.value][0](length, [values for values, _ in arguments]), errors
+
+        (left, left_errors), (right, right_errors) = [self._evaluate(arg, columns, length) for arg in expr.arguments]
+        errors = numpy.where(left_errors != 0, left_errors, right_errors)
+        if expr.type == ExprType.div and numpy.any((right == 0) & (errors == 0)):
+            raise _Fallback # Left to the scalar path to handle like any other division by zero
+        with numpy.errstate(all="ignore"):
+            return _operations[expr.type](left, right), errors
+
+    def evaluate_run(self, run: Run):
+        x, y, length, template, dx, dy = run
+        self.active.add(run)
+        try:
+            columns = {(ref_x, ref_y) : self._column(ref_x + dx, ref_y + dy, length)
+                       for ref_x, ref_y in template.referenced()[0]}
+            values, errors = self._evaluate(template, columns, length)
+        except _Fallback:
+            return
+        finally:
+            self.active.discard(run)
+            self.done.add(run)
+
+        chunks = list(self.table.storage.iter_range(x, y, x, y + length - 1))
+        # Reading the columns evaluated some of the run through a cycle, the scalar path sorts it out
+        for _, _, chunk, start, stop in chunks:
+            if any(index in chunk.results for index in range(start, stop)):
+                return
+
+        values, errors = values.tolist(), errors.tolist()
+        for _, block, chunk, start, stop in chunks:
+            offset = (block << CHUNK_BITS) + start - y
+            results = chunk.results
+            for index in range(start, stop):
+                error = errors[offset + index - start]
+                results[index] = _errors[error] if error else values[offset + index - start]
+        self.evaluated.update((x, row) for row in range(y, y + length))
+
+def evaluate_runs(table: Table, formulas: Set[Coords]) -> Set[Coords]:
+    """
+    Caches results of formulas, which are part of long enough runs, returns their coordinates.
+    Results of formulas read by the runs are cached too. Without NumPy nothing is evaluated
+    """
+    if numpy is None:
+        return set()
+    evaluator = _Evaluator(table, _runs(table, formulas))
+    for runs in evaluator.runs.values():
+        for run in runs:
+            if run not in evaluator.done:
+                evaluator.evaluate_run(run)
+    return evaluator.evaluated
+
+_operations: Dict[ExprType, "function"] = {
+    ExprType.add : operator.add,
+    ExprType.sub : operator.sub,
+    ExprType.mul : operator.mul,
+    ExprType.div : operator.truediv,
+}
+
+# Name -> (function of the row count and argument arrays, amount of arguments)
+_functions: Dict[str, Tuple[Callable[[int, List["numpy.ndarray"]], "numpy.ndarray"], int]] = {
+    "pi"  : (lambda length, args: numpy.full(length, math.pi), 0),
+    "abs" : (lambda length, args: numpy.abs(args[0]), 1),
+}